@@ -1,24 +1,57 @@
 """API routes for report processing."""
 
+import asyncio
+import string
+import unicodedata
 from datetime import datetime
 from io import BytesIO
 
 from fastapi import APIRouter, Depends, File, UploadFile
-from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 
 from app.dependencies import get_transformation_service, get_comparison_service
 from app.services.transformation import TransformationService
 from app.services.comparison import ComparisonService
 
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Filename sanitizing table: keep ASCII letters, digits, "_" and "-",
+# turn spaces into "_" and drop every other ASCII character
+_FILENAME_ALLOWED = set(string.ascii_letters + string.digits + "_-")
+_FILENAME_TABLE = {
+    code: None for code in range(128) if chr(code) not in _FILENAME_ALLOWED
+} | {ord(" "): ord("_")}
+
 
 def _generate_filename(store_code: str, store_name: str) -> str:
     """Generate dynamic filename with date, store code and sanitized store name."""
     today = datetime.now().strftime("%Y-%m-%d")
-    safe_store_name = "".join(
-        c if c.isalnum() or c in " _-" else "" for c in store_name
-    ).replace(" ", "_")
+    # Accented letters are reduced to their ASCII base ("São" -> "Sao")
+    ascii_name = (
+        unicodedata.normalize("NFKD", store_name).encode("ascii", "ignore").decode()
+    )
+    safe_store_name = ascii_name.translate(_FILENAME_TABLE)
     return f"relatorio_processado_{today}_loja_{store_code}_{safe_store_name}.xlsx"
 
+
+def _excel_response(output: BytesIO, filename: str) -> Response:
+    """Send an in-memory xlsx file as a single-body attachment."""
+    return Response(
+        content=output.getvalue(),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+async def _read_pdfs(
+    nf_pdfs: list[UploadFile], pedido_pdfs: list[UploadFile]
+) -> tuple[list[bytes], list[bytes]]:
+    """Read all uploaded PDFs concurrently, returning (nf_contents, pedido_contents)."""
+    contents = await asyncio.gather(*(pdf.read() for pdf in [*nf_pdfs, *pedido_pdfs]))
+    return list(contents[: len(nf_pdfs)]), list(contents[len(nf_pdfs) :])
+
+
 router = APIRouter(prefix="/reports", tags=["reports"])
 
 
@@ -31,7 +64,7 @@ async def process_reports(
     mazza_report: UploadFile = File(default=None, description="Mazza report Excel file (optional, only for store 1225)"),
     transformation_service: TransformationService = Depends(get_transformation_service),
     comparison_service: ComparisonService = Depends(get_comparison_service),
-) -> StreamingResponse:
+) -> Response:
     """
     Process weekly report with inventory comparison.
 
@@ -40,26 +73,25 @@ async def process_reports(
 
     Optionally accepts a Mazza report for store 1225 to merge additional sales data.
     """
-    # Read file contents
-    weekly_content = BytesIO(await weekly_report.read())
-    inventory_content = BytesIO(await inventory_report.read())
+    # Excel uploads are passed as their underlying spooled files (no copy)
+    weekly_content = weekly_report.file
+    inventory_content = inventory_report.file
 
-    nf_pdf_contents = [await pdf.read() for pdf in nf_pdfs]
-    pedido_pdf_contents = [await pdf.read() for pdf in pedido_pdfs]
+    nf_pdf_contents, pedido_pdf_contents = await _read_pdfs(nf_pdfs, pedido_pdfs)
 
-    mazza_content = None
-    if mazza_report:
-        mazza_content = BytesIO(await mazza_report.read())
+    mazza_content = mazza_report.file if mazza_report else None
 
     # Step 1: Transform weekly report with PDF data
-    transformed = transformation_service.process(
+    transformed = await run_in_threadpool(
+        transformation_service.process,
         weekly_excel=weekly_content,
         nf_pdfs=nf_pdf_contents,
         pedido_pdfs=pedido_pdf_contents,
     )
 
     # Step 2: Compare with inventory (and merge Mazza if provided)
-    final_output, store_code, store_name = comparison_service.compare(
+    final_output, store_code, store_name = await run_in_threadpool(
+        comparison_service.compare,
         weekly_report=transformed,
         inventory_report=inventory_content,
         mazza_report=mazza_content,
@@ -69,11 +101,7 @@ async def process_reports(
     filename = _generate_filename(store_code, store_name)
 
     # Return the Excel file
-    return StreamingResponse(
-        final_output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
-    )
+    return _excel_response(final_output, filename)
 
 
 @router.post("/transform")
@@ -82,33 +110,27 @@ async def transform_report(
     nf_pdfs: list[UploadFile] = File(default=[], description="NF PDF files"),
     pedido_pdfs: list[UploadFile] = File(default=[], description="Pedido PDF files"),
     transformation_service: TransformationService = Depends(get_transformation_service),
-) -> StreamingResponse:
+) -> Response:
     """
     Transform weekly report with PDF data (partial processing).
 
     Uploads weekly report and optional PDFs, runs transformation,
     and returns the transformed Excel file.
     """
-    # Read file contents
-    weekly_content = BytesIO(await weekly_report.read())
+    # Excel upload is passed as its underlying spooled file (no copy)
+    weekly_content = weekly_report.file
 
-    nf_pdf_contents = [await pdf.read() for pdf in nf_pdfs]
-    pedido_pdf_contents = [await pdf.read() for pdf in pedido_pdfs]
+    nf_pdf_contents, pedido_pdf_contents = await _read_pdfs(nf_pdfs, pedido_pdfs)
 
     # Transform
-    transformed = transformation_service.process(
+    transformed = await run_in_threadpool(
+        transformation_service.process,
         weekly_excel=weekly_content,
         nf_pdfs=nf_pdf_contents,
         pedido_pdfs=pedido_pdf_contents,
     )
 
-    return StreamingResponse(
-        transformed,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={
-            "Content-Disposition": "attachment; filename=Relatorio_GAC_Semanal_Output.xlsx"
-        },
-    )
+    return _excel_response(transformed, "Relatorio_GAC_Semanal_Output.xlsx")
 
 
 @router.post("/compare")
@@ -119,7 +141,7 @@ async def compare_reports(
     inventory_report: UploadFile = File(..., description="Inventory Excel file"),
     mazza_report: UploadFile = File(default=None, description="Mazza report Excel file (optional, only for store 1225)"),
     comparison_service: ComparisonService = Depends(get_comparison_service),
-) -> StreamingResponse:
+) -> Response:
     """
     Compare transformed weekly report with inventory (partial processing).
 
@@ -128,16 +150,15 @@ async def compare_reports(
 
     Optionally accepts a Mazza report for store 1225 to merge additional sales data.
     """
-    # Read file contents
-    weekly_content = BytesIO(await weekly_report.read())
-    inventory_content = BytesIO(await inventory_report.read())
+    # Excel uploads are passed as their underlying spooled files (no copy)
+    weekly_content = weekly_report.file
+    inventory_content = inventory_report.file
 
-    mazza_content = None
-    if mazza_report:
-        mazza_content = BytesIO(await mazza_report.read())
+    mazza_content = mazza_report.file if mazza_report else None
 
     # Compare (and merge Mazza if provided)
-    final_output, store_code, store_name = comparison_service.compare(
+    final_output, store_code, store_name = await run_in_threadpool(
+        comparison_service.compare,
         weekly_report=weekly_content,
         inventory_report=inventory_content,
         mazza_report=mazza_content,
@@ -146,8 +167,4 @@ async def compare_reports(
     # Generate dynamic filename
     filename = _generate_filename(store_code, store_name)
 
-    return StreamingResponse(
-        final_output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
-    )
+    return _excel_response(final_output, filename)
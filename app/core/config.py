@@ -9,6 +9,7 @@ class Settings(BaseSettings):
     app_name: str = "Cacau Show API"
     app_version: str = "1.0.0"
     debug: bool = False
+    pdf_parser_workers: int | None = None
 
     class Config:
         env_file = ".env"
@@ -1,7 +1,11 @@
 """Dependency injection setup."""
 
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
 from functools import lru_cache
+from threading import Lock
 
+from app.core.config import settings
 from app.services.pdf_parser import PDFParserService
 from app.services.transformation import TransformationService
 from app.services.comparison import ComparisonService
@@ -13,12 +17,46 @@ def get_pdf_parser_service() -> PDFParserService:
     return PDFParserService()
 
 
+@lru_cache
+def get_pdf_executor() -> Executor:
+    """Get the process pool used to parse PDFs in parallel."""
+    # Workers are spawned, not forked: the pool is first used from threadpool
+    # threads of a multithreaded server, where forking can deadlock
+    return ProcessPoolExecutor(
+        max_workers=settings.pdf_parser_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+_pdf_executor_lock = Lock()
+
+
+def replace_pdf_executor(broken: Executor) -> Executor:
+    """
+    Replace a broken PDF process pool (one of its workers died).
+
+    Returns the current pool; concurrent callers holding the same broken
+    pool all get the one replacement.
+    """
+    with _pdf_executor_lock:
+        if get_pdf_executor() is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            get_pdf_executor.cache_clear()
+        return get_pdf_executor()
+
+
+@lru_cache
 def get_transformation_service() -> TransformationService:
     """Get transformation service instance."""
     pdf_parser = get_pdf_parser_service()
-    return TransformationService(pdf_parser=pdf_parser)
+    return TransformationService(
+        pdf_parser=pdf_parser,
+        executor=get_pdf_executor(),
+        replace_executor=replace_pdf_executor,
+    )
 
 
+@lru_cache
 def get_comparison_service() -> ComparisonService:
     """Get comparison service instance."""
     return ComparisonService()
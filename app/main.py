@@ -8,6 +8,7 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.routes import reports
 from app.core.config import settings
+from app.dependencies import get_pdf_executor
 from app.schemas.reports import HealthCheck
 
 # CORS origins from environment variable or defaults for local development
@@ -23,6 +24,8 @@ async def lifespan(app: FastAPI):
     # Startup
     yield
     # Shutdown
+    if get_pdf_executor.cache_info().currsize:
+        get_pdf_executor().shutdown()
 
 
 app = FastAPI(
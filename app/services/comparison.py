@@ -1,21 +1,63 @@
 """Comparison service for inventory reports."""
 
+import hashlib
+from collections import OrderedDict
+from collections.abc import Callable
+from functools import partial
 from io import BytesIO
+from threading import Lock
+from typing import BinaryIO
 
+import numpy as np
 import pandas as pd
 
+from app.services.excel import write_dataframe
+
+# Read size when hashing uploads for the parsed report cache
+_HASH_CHUNK_SIZE = 1 << 20
+
 
 class ComparisonService:
     """Service for comparing weekly reports with inventory data."""
 
-    def _read_inventory(self, inventory_content: BytesIO) -> pd.DataFrame:
-        """Read the inventory Excel file and return a cleaned DataFrame."""
-        df = pd.read_excel(inventory_content, sheet_name="Estoque Produtos com Valor")
+    def __init__(self, cache_size: int = 8):
+        # LRU cache of parsed reports, keyed by reader and file content hash
+        self._cache: OrderedDict[tuple[str, bytes], pd.DataFrame] = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_lock = Lock()
 
-        # First row contains actual column headers
-        df_clean = df.iloc[1:].copy()
-        df_clean.columns = df.iloc[0].values
+    def _read_cached(
+        self, content: BinaryIO, reader: Callable[[BinaryIO], pd.DataFrame]
+    ) -> pd.DataFrame:
+        """Read an Excel file with reader, reusing the result for identical content."""
+        # Hash the upload in chunks and rewind, so it is never held in memory
+        # twice; the reader gets the original file object on a miss
+        start = content.tell()
+        digest = hashlib.blake2b(digest_size=16)
+        for chunk in iter(partial(content.read, _HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        content.seek(start)
+        key = (reader.__name__, digest.digest())
+
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached.copy()
+
+        df = reader(content)
+
+        # The cache keeps its own copy; the freshly parsed frame goes to the caller
+        with self._cache_lock:
+            self._cache[key] = df.copy()
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
 
+        return df
+
+    def _read_inventory(self, inventory_content: BinaryIO) -> pd.DataFrame:
+        """Read the inventory Excel file and return a cleaned DataFrame."""
         # Select columns we need
         cols_to_keep = [
             "Cód. Loja",
@@ -30,24 +72,37 @@ class ComparisonService:
             "R$ VENDA UN",
             "R$ VENDA TOTAL ITEM",
         ]
-        df_clean = df_clean[cols_to_keep].copy()
+
+        # Second row contains actual column headers (first row is a title row).
+        # Columns stay as parsed (object) except the product code.
+        df = pd.read_excel(
+            inventory_content,
+            sheet_name="Estoque Produtos com Valor",
+            header=1,
+            usecols=cols_to_keep,
+            dtype={col: object for col in cols_to_keep} | {"Cód Produto": "string"},
+            engine="calamine",
+        )
 
         # Convert types
-        df_clean["Cód Produto"] = df_clean["Cód Produto"].astype(str)
-        df_clean["Quantidade"] = pd.to_numeric(
-            df_clean["Quantidade"], errors="coerce"
-        ).fillna(0)
+        df["Quantidade"] = pd.to_numeric(df["Quantidade"], errors="coerce").fillna(0)
 
-        return df_clean
+        return df[cols_to_keep]
 
-    def _read_weekly_report(self, weekly_content: BytesIO) -> pd.DataFrame:
+    def _read_weekly_report(self, weekly_content: BinaryIO) -> pd.DataFrame:
         """Read the weekly report Excel file."""
-        df = pd.read_excel(weekly_content, sheet_name="Faturamento por Produtos")
-
-        # Convert product code to string for matching
-        df["Código do Produto"] = df["Código do Produto"].astype(str)
+        # Product code is read as string for matching
+        return pd.read_excel(
+            weekly_content,
+            sheet_name="Faturamento por Produtos",
+            dtype={"Código do Produto": "string"},
+            engine="calamine",
+        )
 
-        return df
+    @staticmethod
+    def _format_grupo(cod_grupo: pd.Series, desc_grupo: pd.Series) -> pd.Series:
+        """Build the "{Cod Grupo} - {Desc GRUPO}" label for each row."""
+        return (cod_grupo.astype(str) + " - " + desc_grupo.astype(str)).str.strip(" -")
 
     def _compare_and_merge(
         self, weekly_df: pd.DataFrame, inventory_df: pd.DataFrame
@@ -64,81 +119,67 @@ class ComparisonService:
         # Get store code from inventory (applies to ALL products since inventory is per-store)
         store_code = inventory_df["Cód. Loja"].iloc[0] if len(inventory_df) > 0 else None
 
-        # Create inventory lookup dicts
-        inventory_lookup = dict(
-            zip(inventory_df["Cód Produto"], inventory_df["Quantidade"])
-        )
-        inventory_cod_grupo = dict(
-            zip(inventory_df["Cód Produto"], inventory_df["Cod Grupo"])
-        )
-        inventory_desc_grupo = dict(
-            zip(inventory_df["Cód Produto"], inventory_df["Desc GRUPO"])
+        # Inventory indexed by product code (last occurrence wins on duplicates)
+        inventory_by_code = inventory_df.drop_duplicates(
+            "Cód Produto", keep="last"
+        ).set_index("Cód Produto")[
+            ["Quantidade", "Cod Grupo", "Desc GRUPO", "Desc Produto"]
+        ]
+
+        # Gather the inventory row of every matching product in one shot,
+        # aligned to the weekly report index
+        codes = result_df["Código do Produto"]
+        positions = inventory_by_code.index.get_indexer(codes)
+        in_inventory = pd.Series(positions >= 0, index=result_df.index)
+        matched = inventory_by_code.iloc[positions[in_inventory.to_numpy()]].set_axis(
+            result_df.index[in_inventory]
         )
-        inventory_desc_produto = dict(
-            zip(inventory_df["Cód Produto"], inventory_df["Desc Produto"])
+        pedido = result_df["Pedido"].fillna(0)
+
+        # Target Estoque: the inventory quantity for existing products, 0 for
+        # products in weekly but not in inventory. Only rows that differ are
+        # written, Estoque and Total (Estoque + Pedido) in one pass each.
+        # (infer_objects: an empty inventory leaves Quantidade as object dtype)
+        new_estoque = (
+            matched["Quantidade"].reindex(result_df.index, fill_value=0).infer_objects()
         )
-
-        # Get existing product codes in weekly report
-        existing_codes = set(result_df["Código do Produto"].tolist())
-
-        # Update existing products
-        for idx, row in result_df.iterrows():
-            product_code = str(row["Código do Produto"])
-            if product_code in inventory_lookup:
-                inv_qty = inventory_lookup[product_code]
-                current_estoque = row["Estoque"]
-
-                if current_estoque != inv_qty:
-                    result_df.at[idx, "Estoque"] = inv_qty
-                    pedido = row["Pedido"] if pd.notna(row["Pedido"]) else 0
-                    result_df.at[idx, "Total"] = inv_qty + pedido
-
-                # Enrich products with empty Grupo (PDF-sourced products)
-                current_grupo = row["Grupo"]
-                if pd.isna(current_grupo) or current_grupo == "":
-                    cod_grupo = inventory_cod_grupo.get(product_code, "")
-                    desc_grupo = inventory_desc_grupo.get(product_code, "")
-                    if cod_grupo or desc_grupo:
-                        result_df.at[idx, "Grupo"] = f"{cod_grupo} - {desc_grupo}".strip(" -")
-                    result_df.at[idx, "Descrição"] = inventory_desc_produto.get(product_code, row["Descrição"])
-            else:
-                # Product exists in weekly but not in inventory -> set Estoque to 0
-                if row["Estoque"] != 0:
-                    result_df.at[idx, "Estoque"] = 0
-                    pedido = row["Pedido"] if pd.notna(row["Pedido"]) else 0
-                    result_df.at[idx, "Total"] = pedido
+        changed = result_df["Estoque"] != new_estoque
+        result_df.loc[changed, "Estoque"] = new_estoque[changed]
+        result_df.loc[changed, "Total"] = new_estoque[changed] + pedido[changed]
+
+        # Enrich products with empty Grupo (PDF-sourced products)
+        grupo = result_df.loc[matched.index, "Grupo"]
+        enrich = matched[grupo.isna() | (grupo == "")]
+        if len(enrich) > 0:
+            has_grupo = enrich["Cod Grupo"].astype(bool) | enrich["Desc GRUPO"].astype(bool)
+            result_df.loc[enrich.index[has_grupo], "Grupo"] = self._format_grupo(
+                enrich.loc[has_grupo, "Cod Grupo"], enrich.loc[has_grupo, "Desc GRUPO"]
+            )
+            result_df.loc[enrich.index, "Descrição"] = enrich["Desc Produto"]
 
         # Set Cód. Loja for ALL products (store code from inventory applies to all)
         result_df["Cód. Loja"] = store_code
 
         # Find products in inventory but not in weekly report
-        inventory_codes = set(inventory_df["Cód Produto"].tolist())
-        new_codes = inventory_codes - existing_codes
-
-        if new_codes:
-            new_rows = []
-            for _, inv_row in inventory_df[
-                inventory_df["Cód Produto"].isin(new_codes)
-            ].iterrows():
-                new_rows.append(
-                    {
-                        "Código do Produto": inv_row["Cód Produto"],
-                        "Descrição": inv_row["Desc Produto"],
-                        "Grupo": f"{inv_row['Cod Grupo']} - {inv_row['Desc GRUPO']}".strip(
-                            " -"
-                        ),
-                        "Estoque": inv_row["Quantidade"],
-                        "Pedido": None,
-                        "Total": inv_row["Quantidade"],
-                        "Saídas": 0,
-                        "Sugestão": None,
-                        "Cód. Loja": inv_row["Cód. Loja"],
-                    }
-                )
-
-            if new_rows:
-                df_new = pd.DataFrame(new_rows)
-                result_df = pd.concat([result_df, df_new], ignore_index=True)
+        new_inventory = inventory_df[~inventory_df["Cód Produto"].isin(codes)]
+
+        if len(new_inventory) > 0:
+            df_new = pd.DataFrame(
+                {
+                    "Código do Produto": new_inventory["Cód Produto"],
+                    "Descrição": new_inventory["Desc Produto"],
+                    "Grupo": self._format_grupo(
+                        new_inventory["Cod Grupo"], new_inventory["Desc GRUPO"]
+                    ),
+                    "Estoque": new_inventory["Quantidade"],
+                    "Pedido": None,
+                    "Total": new_inventory["Quantidade"],
+                    "Saídas": 0,
+                    "Sugestão": None,
+                    "Cód. Loja": new_inventory["Cód. Loja"],
+                }
+            )
+            result_df = pd.concat([result_df, df_new], ignore_index=True)
 
         return result_df
 
@@ -148,73 +189,79 @@ class ComparisonService:
         middle sorted by Descrição ASC.
         """
 
-        def grupo_priority(grupo):
-            if pd.isna(grupo) or grupo == "":
-                return 1  # Middle
-            grupo_str = str(grupo)
-            if "1014" in grupo_str and "Funcionais" in grupo_str:
-                return 0  # First
-            if "1013" in grupo_str and "Pascoa" in grupo_str:
-                return 2  # Last
-            return 1  # Middle
-
-        df_output = df.copy()
-        df_output["_priority"] = df_output["Grupo"].apply(grupo_priority)
+        # Priority: 0 = first, 1 = middle (including empty Grupo), 2 = last
+        grupo = df["Grupo"].astype(str)
+        is_first = grupo.str.contains("1014", regex=False) & grupo.str.contains(
+            "Funcionais", regex=False
+        )
+        is_last = grupo.str.contains("1013", regex=False) & grupo.str.contains(
+            "Pascoa", regex=False
+        )
+        priority = np.select([is_first, is_last], [0, 2], default=1)
+
+        df_output = df.assign(_priority=priority)
         df_output = df_output.sort_values(["_priority", "Descrição"])
         df_output = df_output.drop(columns=["_priority"])
 
         return df_output
 
-    def _read_mazza_report(self, mazza_content: BytesIO) -> pd.DataFrame:
+    def _read_mazza_report(self, mazza_content: BinaryIO) -> pd.DataFrame:
         """Read the Mazza report Excel file."""
-        df = pd.read_excel(mazza_content, sheet_name="RankingFaturamento")
-        df["CODIGO"] = df["CODIGO"].astype(str)
-        return df[["CODIGO", "NOME PRODUTO", "QUANTIDADE"]]
+        return pd.read_excel(
+            mazza_content,
+            sheet_name="RankingFaturamento",
+            usecols=["CODIGO", "NOME PRODUTO", "QUANTIDADE"],
+            dtype={"CODIGO": "string"},
+            engine="calamine",
+        )[["CODIGO", "NOME PRODUTO", "QUANTIDADE"]]
 
     def _merge_mazza_report(
         self, result_df: pd.DataFrame, mazza_df: pd.DataFrame, store_code: str
     ) -> pd.DataFrame:
         """Merge Mazza report data into the result (only for store 1225)."""
-        # Initialize new columns
-        result_df["Saídas VD"] = None
-        result_df["Saídas Total"] = None
-
-        # Create lookup for existing products
-        existing_codes = set(result_df["Código do Produto"].astype(str).tolist())
-
-        for _, mazza_row in mazza_df.iterrows():
-            codigo = str(mazza_row["CODIGO"])
-            quantidade = mazza_row["QUANTIDADE"]
-
-            if codigo in existing_codes:
-                # Match: Set Saídas VD and calculate Saídas Total
-                mask = result_df["Código do Produto"].astype(str) == codigo
-                current_saidas = result_df.loc[mask, "Saídas"].iloc[0]
-                current_saidas = current_saidas if pd.notna(current_saidas) else 0
-                current_saidas_vd = result_df.loc[mask, "Saídas VD"].iloc[0]
-                current_saidas_vd = current_saidas_vd if pd.notna(current_saidas_vd) else 0
-
-                result_df.loc[mask, "Saídas VD"] = current_saidas_vd + quantidade
-                result_df.loc[mask, "Saídas Total"] = current_saidas + current_saidas_vd + quantidade
-            else:
-                # No match: Add new row
-                new_row = {
+        codes = result_df["Código do Produto"]
+        mazza_codes = mazza_df["CODIGO"]
+
+        # Total Mazza quantity per product, in order of first appearance
+        mazza_qty = mazza_df["QUANTIDADE"].groupby(mazza_codes, sort=False).sum()
+
+        # Match: Saídas VD is the Mazza total, Saídas Total adds the current Saídas
+        # (taken from the first row of each product)
+        matched = codes.isin(mazza_qty.index)
+        first_rows = ~codes.duplicated()
+        first_saidas = pd.Series(
+            result_df["Saídas"].to_numpy()[first_rows], index=codes[first_rows]
+        )
+        saidas_vd = codes.map(mazza_qty)
+        result_df["Saídas VD"] = saidas_vd.where(matched)
+        result_df["Saídas Total"] = (
+            pd.to_numeric(codes.map(first_saidas)).fillna(0) + saidas_vd
+        ).where(matched)
+
+        # No match: add one new row per Mazza-only product
+        new_qty = mazza_qty[~mazza_qty.index.isin(codes)]
+        if len(new_qty) > 0:
+            mazza_names = (
+                mazza_df["NOME PRODUTO"]
+                .set_axis(mazza_codes)
+                .loc[~mazza_codes.duplicated().to_numpy()]
+            )
+            df_new = pd.DataFrame(
+                {
                     "Cód. Loja": store_code,
-                    "Código do Produto": codigo,
-                    "Descrição": mazza_row["NOME PRODUTO"],
+                    "Código do Produto": new_qty.index,
+                    "Descrição": mazza_names.reindex(new_qty.index).to_numpy(),
                     "Grupo": None,
                     "Estoque": None,
                     "Pedido": None,
                     "Total": None,
                     "Saídas": None,
-                    "Saídas VD": quantidade,
-                    "Saídas Total": quantidade,
+                    "Saídas VD": new_qty.to_numpy(),
+                    "Saídas Total": new_qty.to_numpy(),
                     "Sugestão": None,
                 }
-                result_df = pd.concat(
-                    [result_df, pd.DataFrame([new_row])], ignore_index=True
-                )
-                existing_codes.add(codigo)
+            )
+            result_df = pd.concat([result_df, df_new], ignore_index=True)
 
         # Reorder columns: ensure Saídas VD and Saídas Total come after Saídas, before Sugestão
         cols = result_df.columns.tolist()
@@ -228,14 +275,14 @@ class ComparisonService:
 
         return result_df
 
-    def compare(
+    def build_report(
         self,
-        weekly_report: BytesIO,
-        inventory_report: BytesIO,
-        mazza_report: BytesIO = None,
-    ) -> tuple[BytesIO, str, str]:
+        weekly_report: BinaryIO,
+        inventory_report: BinaryIO,
+        mazza_report: BinaryIO | None = None,
+    ) -> tuple[pd.DataFrame, str, str]:
         """
-        Compare weekly report with inventory and produce final report.
+        Compare weekly report with inventory and build the final report data.
 
         Args:
             weekly_report: Transformed weekly report Excel content
@@ -243,11 +290,11 @@ class ComparisonService:
             mazza_report: Optional Mazza report Excel content (only for store 1225)
 
         Returns:
-            Tuple of (BytesIO containing the compared Excel file, store_code, store_name)
+            Tuple of (final report DataFrame, store_code, store_name)
         """
         # Read both files
-        inventory_df = self._read_inventory(inventory_report)
-        weekly_df = self._read_weekly_report(weekly_report)
+        inventory_df = self._read_cached(inventory_report, self._read_inventory)
+        weekly_df = self._read_cached(weekly_report, self._read_weekly_report)
 
         # Extract store name from inventory
         store_name = str(inventory_df["Loja"].iloc[0]) if len(inventory_df) > 0 else "Unknown"
@@ -263,7 +310,7 @@ class ComparisonService:
 
         # Merge Mazza report if provided and store is 1225
         if mazza_report is not None and store_code == "1225":
-            mazza_df = self._read_mazza_report(mazza_report)
+            mazza_df = self._read_cached(mazza_report, self._read_mazza_report)
             df_output = self._merge_mazza_report(df_output, mazza_df, store_code)
 
         # Reorder columns so Cód. Loja is first
@@ -273,12 +320,30 @@ class ComparisonService:
             cols = ["Cód. Loja"] + cols
             df_output = df_output[cols]
 
+        return df_output, store_code, store_name
+
+    def compare(
+        self,
+        weekly_report: BinaryIO,
+        inventory_report: BinaryIO,
+        mazza_report: BinaryIO | None = None,
+    ) -> tuple[BytesIO, str, str]:
+        """
+        Compare weekly report with inventory and produce final report.
+
+        Args:
+            weekly_report: Transformed weekly report Excel content
+            inventory_report: Inventory Excel file content
+            mazza_report: Optional Mazza report Excel content (only for store 1225)
+
+        Returns:
+            Tuple of (BytesIO containing the compared Excel file, store_code, store_name)
+        """
+        df_output, store_code, store_name = self.build_report(
+            weekly_report, inventory_report, mazza_report
+        )
+
         # Write to BytesIO
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            df_output.to_excel(
-                writer, sheet_name="Faturamento por Produtos", index=False
-            )
+        output = write_dataframe(df_output, sheet_name="Faturamento por Produtos")
 
-        output.seek(0)
         return output, store_code, store_name
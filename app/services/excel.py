@@ -0,0 +1,48 @@
+"""Excel writing helpers shared by the report services."""
+
+from io import BytesIO
+from typing import IO
+
+import pandas as pd
+import xlsxwriter
+
+# Same header look as pandas' default to_excel output
+HEADER_FORMAT = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+
+
+def write_sheet(df: pd.DataFrame, sheet_name: str, target: str | IO[bytes]) -> None:
+    """
+    Write a DataFrame to a single-sheet xlsx file at a path or into a buffer.
+
+    Rows are streamed through xlsxwriter in constant_memory mode, which
+    flushes each row as soon as the next one starts. pandas' to_excel
+    writes cells column by column and cannot be combined with that mode,
+    so rows are written here directly.
+    """
+    workbook = xlsxwriter.Workbook(
+        target,
+        {
+            "constant_memory": True,
+            "strings_to_formulas": False,
+            "strings_to_urls": False,
+        },
+    )
+    worksheet = workbook.add_worksheet(sheet_name)
+
+    worksheet.write_row(
+        0, 0, [str(col) for col in df.columns], workbook.add_format(HEADER_FORMAT)
+    )
+
+    values = df.astype(object).where(df.notna(), None)
+    for row_idx, row in enumerate(values.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(row_idx, 0, row)
+
+    workbook.close()
+
+
+def write_dataframe(df: pd.DataFrame, sheet_name: str) -> BytesIO:
+    """Write a DataFrame to a single-sheet xlsx file in memory."""
+    output = BytesIO()
+    write_sheet(df, sheet_name, output)
+    output.seek(0)
+    return output
@@ -1,10 +1,89 @@
 """PDF parsing service for NF and Pedido documents."""
 
 import re
+from functools import lru_cache
 from io import BytesIO
 
 import fitz  # PyMuPDF
 
+# Text extraction flags: plain-text defaults without ligature or whitespace
+# preservation, which the parsers never need (codes and quantities are plain
+# digits, and any whitespace run is treated alike). Dehyphenation is already off.
+# Also used by the transformations.py script.
+TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~(
+    fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE
+)
+
+# PDF files start with this marker; readers accept it within the first 1 KiB
+_PDF_HEADER = b"%PDF-"
+_PDF_HEADER_WINDOW = 1024
+
+# Unit extraction patterns, in priority order (matched against upper-cased text)
+_RE_WEIGHT_X_UN = re.compile(r"\d+(?:[,\.]\d+)?(?:G|KG)X(\d+)U(?:N)?")
+_RE_X_UN = re.compile(r"X(\d+)UN")
+_RE_TRAIL_X = re.compile(r"\s+X\s+(\d+)\s*$")
+_RE_STANDALONE_UN = re.compile(r"(\d+)UN")
+
+# Description normalization: unit info like "100GX15UN" or "13,5GX150UN"
+_RE_UNIT_STRIP = re.compile(r"\s*\d+(?:,\d+)?(?:G|KG)X\d+U(?:N)?\s*")
+
+# Record patterns for the PDF table scanners, matched against the whole text
+# (shared with the transformations.py script).
+# Fields sit on their own lines; surrounding whitespace on each line is ignored.
+# The whole record is a lookahead so overlapping records are all found, and the
+# lazy skip finds the first quantity line inside the window.
+RE_NF_RECORD = re.compile(
+    r"^(?="
+    r"[^\S\n]*([12]\d{6})[^\S\n]*\n"  # CÓD. PRODUTO
+    r"([^\n]*)"  # description
+    r"(?:\n[^\n]*){0,7}?"  # up to 7 other columns (NCM/SH, CST, CFOP, UND...)
+    r"\n[^\S\n]*(\d+)[,.]0{3}[^\S\n]*$"  # QTDE, e.g. "2,000"
+    r")",
+    re.MULTILINE,
+)
+RE_PEDIDO_RECORD = re.compile(
+    r"^(?="
+    r"[^\S\n]*(\d{2,3})[^\S\n]*\n"  # ITEM (10, 20, 30...)
+    r"[^\S\n]*([12]\d{6})[^\S\n]*\n"  # MATERIAL
+    r"([^\n]*)"  # DENOMINACAO
+    r"(?:\n[^\n]*){0,4}?"  # up to 4 other columns
+    r"\n[^\S\n]*(\d+)[,.]0{3}[^\S\n]*$"  # QUANTIDADE, e.g. "1,000"
+    r")",
+    re.MULTILINE,
+)
+
+
+@lru_cache(maxsize=4096)
+def _units_per_package(description: str) -> int:
+    """Cached body of PDFParserService.extract_units_from_description."""
+    if not description:
+        return 1
+
+    desc_upper = description.upper()
+
+    # Priority 1: "{weight}GX{units}UN" - most explicit unit indicator
+    # Handles decimal weights like "13,5G" in "TRUFA LACREME GIANDUIA 13,5GX150UN"
+    match = _RE_WEIGHT_X_UN.search(desc_upper)
+    if match:
+        return int(match.group(1))
+
+    # Priority 2: "X{units}UN" without weight prefix
+    match = _RE_X_UN.search(desc_upper)
+    if match:
+        return int(match.group(1))
+
+    # Priority 3: " X {number}" at the end (fallback for NF PDFs without UN)
+    match = _RE_TRAIL_X.search(desc_upper)
+    if match:
+        return int(match.group(1))
+
+    # Priority 4: "{number}UN" standalone (e.g., "72UN")
+    match = _RE_STANDALONE_UN.search(desc_upper)
+    if match:
+        return int(match.group(1))
+
+    return 1
+
 
 class PDFParserService:
     """Service for parsing NF and Pedido PDF documents."""
@@ -19,33 +98,7 @@ class PDFParserService:
         - "X 15" at the end (NF format) -> 15
         - "72UN" -> 72 (standalone UN suffix)
         """
-        if not description:
-            return 1
-
-        desc_upper = description.upper()
-
-        # Priority 1: "{weight}GX{units}UN" - most explicit unit indicator
-        # Handles decimal weights like "13,5G" in "TRUFA LACREME GIANDUIA 13,5GX150UN"
-        match = re.search(r"\d+(?:[,\.]\d+)?(?:G|KG)X(\d+)U(?:N)?", desc_upper)
-        if match:
-            return int(match.group(1))
-
-        # Priority 2: "X{units}UN" without weight prefix
-        match = re.search(r"X(\d+)UN", desc_upper)
-        if match:
-            return int(match.group(1))
-
-        # Priority 3: " X {number}" at the end (fallback for NF PDFs without UN)
-        match = re.search(r"\s+X\s+(\d+)\s*$", desc_upper)
-        if match:
-            return int(match.group(1))
-
-        # Priority 4: "{number}UN" standalone (e.g., "72UN")
-        match = re.search(r"(\d+)UN", desc_upper)
-        if match:
-            return int(match.group(1))
-
-        return 1
+        return _units_per_package(description)
 
     def normalize_description(self, description: str) -> str:
         """
@@ -57,16 +110,25 @@ class PDFParserService:
             return ""
 
         # Remove the trailing " X {number}" part
-        desc = re.sub(r"\s+X\s+\d+\s*$", "", description)
+        desc = _RE_TRAIL_X.sub("", description)
 
         # Remove the unit info like "100GX15UN" or "13,5GX150UN"
-        desc = re.sub(r"\s*\d+(?:,\d+)?(?:G|KG)X\d+U(?:N)?\s*", " ", desc)
+        desc = _RE_UNIT_STRIP.sub(" ", desc)
 
         # Clean up extra spaces
         desc = " ".join(desc.split())
 
         return desc
 
+    def _extract_text(self, pdf_content: bytes) -> str:
+        """Extract the plain text of all pages, in page order."""
+        # Empty or non-PDF uploads have no text; skip opening them with fitz
+        if _PDF_HEADER not in pdf_content[:_PDF_HEADER_WINDOW]:
+            return ""
+
+        with fitz.open(stream=pdf_content, filetype="pdf") as pdf:
+            return "".join(page.get_text("text", flags=TEXT_FLAGS) for page in pdf)
+
     def parse_nf_pdf(self, pdf_content: bytes) -> tuple[dict, dict]:
         """
         Parse NF (Nota Fiscal) PDF and extract product quantities.
@@ -80,53 +142,27 @@ class PDFParserService:
         descriptions: dict[str, str] = {}
 
         try:
-            pdf = fitz.open(stream=pdf_content, filetype="pdf")
-            full_text = ""
-            for page in pdf:
-                full_text += page.get_text()
-            pdf.close()
-
-            lines = full_text.split("\n")
-
-            i = 0
-            while i < len(lines):
-                line = lines[i].strip()
-
-                # Check if this line starts with a product code (7 digits starting with 1 or 2)
-                code_match = re.match(r"^([12]\d{6})$", line)
-                if code_match:
-                    product_code = code_match.group(1)
-
-                    # Next line should be the description
-                    if i + 1 < len(lines):
-                        description = lines[i + 1].strip()
-
-                        # Extract units from description
-                        units_per_package = self.extract_units_from_description(
+            full_text = self._extract_text(pdf_content)
+
+            for match in RE_NF_RECORD.finditer(full_text):
+                product_code = match.group(1)
+                description = match.group(2).strip()
+                qty = int(match.group(3))
+
+                if qty > 0:
+                    # Extract units from description
+                    units_per_package = self.extract_units_from_description(
+                        description
+                    )
+                    total_units = qty * units_per_package
+                    if product_code in quantities:
+                        quantities[product_code] += total_units
+                    else:
+                        quantities[product_code] = total_units
+                        descriptions[product_code] = self.normalize_description(
                             description
                         )
 
-                        # Look for quantity in nearby lines
-                        qty = 0
-                        for j in range(i + 2, min(i + 10, len(lines))):
-                            qty_line = lines[j].strip()
-                            qty_match = re.match(r"^(\d+)[,.]0{3}$", qty_line)
-                            if qty_match:
-                                qty = int(qty_match.group(1))
-                                break
-
-                        if qty > 0:
-                            total_units = qty * units_per_package
-                            if product_code in quantities:
-                                quantities[product_code] += total_units
-                            else:
-                                quantities[product_code] = total_units
-                                descriptions[product_code] = self.normalize_description(
-                                    description
-                                )
-
-                i += 1
-
         except Exception:
             pass
 
@@ -145,63 +181,30 @@ class PDFParserService:
         descriptions: dict[str, str] = {}
 
         try:
-            pdf = fitz.open(stream=pdf_content, filetype="pdf")
-            full_text = ""
-            for page in pdf:
-                full_text += page.get_text()
-            pdf.close()
-
-            lines = full_text.split("\n")
-
-            i = 0
-            while i < len(lines):
-                line = lines[i].strip()
-
-                # In pedidos PDFs, the format is:
-                # ITEM (10, 20, 30...)
-                # MATERIAL (product code)
-                # DENOMINACAO (description)
-                # QUANTIDADE (quantity with decimals)
-
-                # Check if this is an ITEM number (10, 20, 30, etc.)
-                if re.match(r"^\d{2,3}$", line) and int(line) % 10 == 0:
-                    # Next should be product code (MATERIAL column)
-                    if i + 1 < len(lines):
-                        code_line = lines[i + 1].strip()
-                        code_match = re.match(r"^([12]\d{6})$", code_line)
-
-                        if code_match:
-                            product_code = code_match.group(1)
-
-                            # Next is description (DENOMINACAO column)
-                            if i + 2 < len(lines):
-                                description = lines[i + 2].strip()
-                                units_per_package = (
-                                    self.extract_units_from_description(description)
-                                )
-
-                                # Look for quantity (format: "1,000" or "3,000")
-                                qty = 0
-                                for j in range(i + 3, min(i + 8, len(lines))):
-                                    qty_line = lines[j].strip()
-                                    qty_match = re.match(
-                                        r"^(\d+)[,.]0{3}\s*$", qty_line
-                                    )
-                                    if qty_match:
-                                        qty = int(qty_match.group(1))
-                                        break
-
-                                if qty > 0:
-                                    total_units = qty * units_per_package
-                                    if product_code in quantities:
-                                        quantities[product_code] += total_units
-                                    else:
-                                        quantities[product_code] = total_units
-                                        descriptions[product_code] = (
-                                            self.normalize_description(description)
-                                        )
-
-                i += 1
+            full_text = self._extract_text(pdf_content)
+
+            for match in RE_PEDIDO_RECORD.finditer(full_text):
+                item, product_code, description, qty = match.groups()
+
+                # ITEM numbers are multiples of 10
+                if int(item) % 10 != 0:
+                    continue
+
+                description = description.strip()
+                qty = int(qty)
+
+                if qty > 0:
+                    units_per_package = self.extract_units_from_description(
+                        description
+                    )
+                    total_units = qty * units_per_package
+                    if product_code in quantities:
+                        quantities[product_code] += total_units
+                    else:
+                        quantities[product_code] = total_units
+                        descriptions[product_code] = self.normalize_description(
+                            description
+                        )
 
         except Exception:
             pass
@@ -1,26 +1,116 @@
 """Transformation service for weekly reports."""
 
+import hashlib
+from collections import Counter, OrderedDict
+from collections.abc import Callable, Iterator
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
+from itertools import chain
+from threading import Lock
+from typing import BinaryIO
 
 import pandas as pd
 
+from app.services.excel import write_dataframe
 from app.services.pdf_parser import PDFParserService
 
 
 class TransformationService:
     """Service for transforming weekly reports with PDF data."""
 
-    def __init__(self, pdf_parser: PDFParserService):
+    def __init__(
+        self,
+        pdf_parser: PDFParserService,
+        executor: Executor | None = None,
+        cache_size: int = 128,
+        replace_executor: Callable[[Executor], Executor] | None = None,
+    ):
         self.pdf_parser = pdf_parser
+        self.executor = executor
+        # Called with a broken process pool (a worker died) to get a new one
+        self.replace_executor = replace_executor
+        # LRU cache of parse results, keyed by parser and PDF content hash.
+        # Kept here rather than in the parser, which runs in worker processes.
+        self._cache: OrderedDict[tuple[str, bytes], tuple[dict, dict]] = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_lock = Lock()
+
+    def _map(self, func, items: list[bytes]):
+        """Map func over items, in parallel when an executor is configured."""
+        if self.executor is None or len(items) < 2:
+            return map(func, items)
+
+        executor = self.executor
+        try:
+            results = executor.map(func, items)
+        except BrokenProcessPool:
+            # The pool broke during an earlier call; submit to a new one
+            if self.replace_executor is None:
+                raise
+            executor = self.executor = self.replace_executor(executor)
+            results = executor.map(func, items)
+        return self._retry_broken(func, items, executor, results)
+
+    def _retry_broken(
+        self, func, items: list[bytes], executor: Executor, results: Iterator
+    ) -> Iterator:
+        """
+        Yield results in order. If the pool breaks while they are pending, it is
+        replaced and the items still without a result are retried once there.
+        """
+        done = 0
+        try:
+            for result in results:
+                yield result
+                done += 1
+        except BrokenProcessPool:
+            if self.replace_executor is None:
+                raise
+            executor = self.executor = self.replace_executor(executor)
+            yield from executor.map(func, items[done:])
+
+    def _parse_cached(
+        self, parse: Callable[[bytes], tuple[dict, dict]], pdfs: list[bytes]
+    ) -> Iterator[tuple[dict, dict]]:
+        """
+        Parse PDFs with parse, reusing results for previously seen content.
 
-    def _read_source_excel(self, excel_content: BytesIO) -> pd.DataFrame:
-        """Read the source Excel file and return a cleaned DataFrame."""
-        df = pd.read_excel(excel_content, sheet_name="Faturamento por Produtos")
+        PDFs not in the cache are submitted right away; results are yielded
+        in input order.
+        """
+        keys = [
+            (parse.__name__, hashlib.blake2b(pdf, digest_size=16).digest())
+            for pdf in pdfs
+        ]
+        with self._cache_lock:
+            cached = [self._cache.get(key) for key in keys]
+            for key, result in zip(keys, cached):
+                if result is not None:
+                    self._cache.move_to_end(key)
 
-        # The first row contains actual column headers
-        df_clean = df.iloc[1:].copy()
-        df_clean.columns = df.iloc[0].values
+        parsed = self._map(parse, [pdf for pdf, hit in zip(pdfs, cached) if hit is None])
+        return self._merge_parsed(keys, cached, parsed)
 
+    def _merge_parsed(
+        self,
+        keys: list[tuple[str, bytes]],
+        cached: list[tuple[dict, dict] | None],
+        parsed: Iterator[tuple[dict, dict]],
+    ) -> Iterator[tuple[dict, dict]]:
+        """Fill cache misses from parsed (in order), storing the new results."""
+        for key, result in zip(keys, cached):
+            if result is None:
+                result = next(parsed)
+                with self._cache_lock:
+                    self._cache[key] = result
+                    self._cache.move_to_end(key)
+                    while len(self._cache) > self._cache_size:
+                        self._cache.popitem(last=False)
+            yield result
+
+    def _read_source_excel(self, excel_content: BinaryIO) -> pd.DataFrame:
+        """Read the source Excel file and return a cleaned DataFrame."""
         # Select required columns
         cols = [
             "Código do Produto",
@@ -29,7 +119,17 @@ class TransformationService:
             "Estoque",
             "Quantidade Líquida",
         ]
-        df_clean = df_clean[cols].copy()
+
+        # The second row contains actual column headers (the first one is
+        # metadata). Only the required columns are parsed, kept as read.
+        df_clean = pd.read_excel(
+            excel_content,
+            sheet_name="Faturamento por Produtos",
+            header=1,
+            usecols=cols,
+            dtype={col: object for col in cols},
+            engine="calamine",
+        )[cols]
 
         # Convert numeric columns
         df_clean["Código do Produto"] = df_clean["Código do Produto"].astype(str)
@@ -40,10 +140,11 @@ class TransformationService:
             df_clean["Quantidade Líquida"], errors="coerce"
         ).fillna(0)
 
-        # Filter out totals row
-        df_clean = df_clean[
-            ~df_clean["Descrição"].str.contains("Totais", case=False, na=False)
-        ]
+        # Filter out totals row (plain substring search, no regex compilation)
+        is_totals = df_clean["Descrição"].str.contains(
+            "Totais", case=False, regex=False, na=False
+        )
+        df_clean = df_clean[~is_totals]
 
         return df_clean
 
@@ -55,32 +156,20 @@ class TransformationService:
 
         Returns a tuple: (quantities_dict, descriptions_dict)
         """
-        all_quantities: dict[str, int] = {}
+        all_quantities: Counter[str] = Counter()
         all_descriptions: dict[str, str] = {}
 
-        # Process NF PDFs
-        for pdf_content in nf_pdfs:
-            quantities, descriptions = self.pdf_parser.parse_nf_pdf(pdf_content)
-            for code, qty in quantities.items():
-                if code in all_quantities:
-                    all_quantities[code] += qty
-                else:
-                    all_quantities[code] = qty
-                if code not in all_descriptions and code in descriptions:
-                    all_descriptions[code] = descriptions[code]
-
-        # Process Pedido PDFs
-        for pdf_content in pedido_pdfs:
-            quantities, descriptions = self.pdf_parser.parse_pedido_pdf(pdf_content)
-            for code, qty in quantities.items():
-                if code in all_quantities:
-                    all_quantities[code] += qty
-                else:
-                    all_quantities[code] = qty
-                if code not in all_descriptions and code in descriptions:
-                    all_descriptions[code] = descriptions[code]
-
-        return all_quantities, all_descriptions
+        # Submit both batches up front so all PDFs are parsed concurrently
+        nf_results = self._parse_cached(self.pdf_parser.parse_nf_pdf, nf_pdfs)
+        pedido_results = self._parse_cached(self.pdf_parser.parse_pedido_pdf, pedido_pdfs)
+
+        # Sum quantities over NF then Pedido PDFs; the first description seen wins
+        for quantities, descriptions in chain(nf_results, pedido_results):
+            all_quantities.update(quantities)
+            for code, description in descriptions.items():
+                all_descriptions.setdefault(code, description)
+
+        return dict(all_quantities), all_descriptions
 
     def _create_final_report(
         self,
@@ -89,33 +178,39 @@ class TransformationService:
         pending_descriptions: dict,
     ) -> pd.DataFrame:
         """Create the final report DataFrame with all calculated fields."""
-        # Get existing product codes from Excel
-        existing_codes = set(df["Código do Produto"].tolist())
-
-        # Find new products from PDFs (not in Excel)
-        new_codes = set(pending_quantities.keys()) - existing_codes
+        # Find new products from PDFs (not in Excel), in PDF order
+        new_codes = pd.Index(list(pending_quantities), dtype=object).difference(
+            df["Código do Produto"], sort=False
+        )
 
-        if new_codes:
+        if len(new_codes) > 0:
             # Create rows for new products
-            new_rows = []
-            for code in new_codes:
-                new_rows.append(
-                    {
-                        "Código do Produto": code,
-                        "Descrição": pending_descriptions.get(code, f"Produto {code}"),
-                        "Grupo": "",
-                        "Estoque": 0,
-                        "Quantidade Líquida": 0,
-                    }
-                )
-            df_new = pd.DataFrame(new_rows)
+            df_new = pd.DataFrame(
+                {
+                    "Código do Produto": new_codes,
+                    "Descrição": [
+                        pending_descriptions.get(code, f"Produto {code}")
+                        for code in new_codes
+                    ],
+                    "Grupo": "",
+                    "Estoque": 0,
+                    "Quantidade Líquida": 0,
+                }
+            )
             df = pd.concat([df, df_new], ignore_index=True)
 
-        # Add pending orders column
-        df["Pedido"] = df["Código do Produto"].map(pending_quantities)
+        # Add pending orders column (hash join on the product code)
+        pending_df = pd.DataFrame(
+            {
+                "Código do Produto": pd.Series(list(pending_quantities), dtype=object),
+                "Pedido": pd.Series(list(pending_quantities.values()), dtype="int64"),
+            }
+        )
+        df = df.merge(pending_df, on="Código do Produto", how="left")
 
-        # Calculate Total = Estoque + Pedido
-        df["Total"] = df["Estoque"].fillna(0) + df["Pedido"].fillna(0)
+        # Calculate Total = Estoque + Pedido; Estoque is never NaN here, and a
+        # missing Pedido counts as 0 (filled inside the add, no temporaries)
+        df["Total"] = df["Estoque"].add(df["Pedido"], fill_value=0)
         df["Sugestão"] = None
 
         # Rename columns to match expected output
@@ -130,7 +225,7 @@ class TransformationService:
                 "Quantidade Líquida",
                 "Sugestão",
             ]
-        ].copy()
+        ]
         df_output.columns = [
             "Código do Produto",
             "Descrição",
@@ -149,7 +244,7 @@ class TransformationService:
 
     def process(
         self,
-        weekly_excel: BytesIO,
+        weekly_excel: BinaryIO,
         nf_pdfs: list[bytes],
         pedido_pdfs: list[bytes],
     ) -> BytesIO:
@@ -176,9 +271,4 @@ class TransformationService:
         df_output = self._create_final_report(df, pending_quantities, pending_descriptions)
 
         # Write to BytesIO
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            df_output.to_excel(writer, sheet_name="Faturamento por Produtos", index=False)
-
-        output.seek(0)
-        return output
+        return write_dataframe(df_output, sheet_name="Faturamento por Produtos")
@@ -10,9 +10,18 @@ Usage:
     python comparison.py
 """
 
+import hashlib
+import os
+import pickle
+import tempfile
+from functools import wraps
+
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
+from app.services.excel import write_sheet
+
 
 # Configuration
 BASE_DIR = Path(__file__).parent
@@ -20,40 +29,97 @@ INVENTORY_EXCEL = BASE_DIR / "/home/nicholas10/cacaushow/relatorio_inv_nao_trata
 WEEKLY_REPORT = BASE_DIR / "relatorios_tratados/Relatorio_GAC_Semanal_Output.xlsx"
 OUTPUT_DIR = BASE_DIR / "relatorio_tratado_comparado"
 OUTPUT_EXCEL = OUTPUT_DIR / "Relatorio_Comparado_Output.xlsx"
+CACHE_DIR = Path.home() / ".cache" / "cacau_show"
+# Bump whenever a cached reader changes what it returns, so stale pickles are
+# never served for an unchanged workbook
+CACHE_VERSION = 2
+
 
+def _digest(text: str) -> str:
+    """Short hex digest used in cache file names."""
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def cache_df(read_func):
+    """
+    Cache a reader's DataFrame on disk, keyed by the source file's path,
+    modification time and size, so unchanged workbooks are not re-parsed.
 
+    Only the latest entry per reader and path is kept. Unreadable entries
+    (e.g. left truncated by an interrupted older version) are re-parsed.
+    """
+    @wraps(read_func)
+    def wrapper(excel_path: str) -> pd.DataFrame:
+        stat = os.stat(excel_path)
+        source_key = _digest(f"{read_func.__name__}:{os.path.abspath(excel_path)}")
+        version_key = _digest(f"{CACHE_VERSION}:{stat.st_mtime_ns}:{stat.st_size}")
+        cache_path = CACHE_DIR / f"{source_key}-{version_key}.pkl"
+
+        if cache_path.exists():
+            try:
+                return pd.read_pickle(cache_path)
+            except (EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+                cache_path.unlink(missing_ok=True)
+
+        df = read_func(excel_path)
+
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for old_path in CACHE_DIR.glob(f"{source_key}-*.pkl"):
+            old_path.unlink(missing_ok=True)
+        # Write to a temporary file first so an interrupted run never leaves a
+        # partial pickle under the final name
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        os.close(fd)
+        try:
+            df.to_pickle(tmp_path)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return df
+
+    return wrapper
+
+
+@cache_df
 def read_inventory(excel_path: str) -> pd.DataFrame:
     """
     Read the inventory Excel file and return a cleaned DataFrame.
     """
-    df = pd.read_excel(excel_path, sheet_name='Estoque Produtos com Valor')
+    df = pd.read_excel(excel_path, sheet_name='Estoque Produtos com Valor', engine='calamine')
 
-    # First row contains actual column headers
-    df_clean = df.iloc[1:].copy()
+    # First row contains actual column headers (a view; the column selection
+    # below makes the only copy)
+    df_clean = df.iloc[1:]
     df_clean.columns = df.iloc[0].values
 
     # Select and rename columns we need
     cols_to_keep = ['Cód Produto', 'Desc Produto', 'Cod Grupo', 'Desc GRUPO', 'Quantidade',
                     'R$ CUSTO UN', 'R$ CUSTO TOTAL ITEM', 'R$ VENDA UN', 'R$ VENDA TOTAL ITEM']
-    df_clean = df_clean[cols_to_keep].copy()
+    df_clean = df_clean[cols_to_keep]
 
     # Convert types
     df_clean['Cód Produto'] = df_clean['Cód Produto'].astype(str)
     df_clean['Quantidade'] = pd.to_numeric(df_clean['Quantidade'], errors='coerce').fillna(0)
 
+    # Codes and groups repeat a lot: store them as categoricals so lookups
+    # hash the (few) categories instead of every cell
+    df_clean = df_clean.astype({'Cód Produto': 'category', 'Cod Grupo': 'category', 'Desc GRUPO': 'category'})
+
     return df_clean
 
 
+@cache_df
 def read_weekly_report(excel_path: str) -> pd.DataFrame:
     """
     Read the weekly report Excel file.
     """
-    df = pd.read_excel(excel_path, sheet_name='Faturamento por Produtos')
+    df = pd.read_excel(excel_path, sheet_name='Faturamento por Produtos', engine='calamine')
 
     # Convert product code to string for matching
     df['Código do Produto'] = df['Código do Produto'].astype(str)
 
-    return df
+    return df.astype({'Código do Produto': 'category', 'Grupo': 'category'})
 
 
 def compare_and_merge(weekly_df: pd.DataFrame, inventory_df: pd.DataFrame) -> pd.DataFrame:
@@ -66,63 +132,55 @@ def compare_and_merge(weekly_df: pd.DataFrame, inventory_df: pd.DataFrame) -> pd
     # Create a copy to avoid modifying original
     result_df = weekly_df.copy()
 
-    # Create inventory lookup dict: {product_code: quantidade}
-    inventory_lookup = dict(zip(inventory_df['Cód Produto'], inventory_df['Quantidade']))
+    # Inventory quantity per product code (last occurrence wins on duplicates)
+    inventory_lookup = inventory_df.drop_duplicates('Cód Produto', keep='last').set_index(
+        'Cód Produto'
+    )['Quantidade']
+
+    # Get existing product codes in weekly report
+    existing_codes = pd.Index(result_df['Código do Produto'])
+
+    codes = result_df['Código do Produto'].astype(str)
+    matched = codes.isin(inventory_lookup.index)
+    inv_qty = codes.map(inventory_lookup)
+    pedido = result_df['Pedido'].fillna(0)
+
+    # Target Estoque: the inventory quantity for existing products, 0 for
+    # products in weekly but not in inventory. Only rows that differ are
+    # written, Estoque and Total (Estoque + Pedido) in one pass each.
+    new_estoque = inv_qty.where(matched, 0)
+    changed = result_df['Estoque'] != new_estoque
+    result_df.loc[changed, 'Estoque'] = new_estoque[changed]
+    result_df.loc[changed, 'Total'] = new_estoque[changed] + pedido[changed]
+    update_mask = changed & matched
+    zero_mask = changed & ~matched
 
     # Track statistics
-    matches = 0
-    updates = 0
+    matches = np.count_nonzero(matched.to_numpy())
+    updates = np.count_nonzero(update_mask.to_numpy())
+    zeroed = np.count_nonzero(zero_mask.to_numpy())
     new_products = 0
-    zeroed = 0
 
-    # Get existing product codes in weekly report
-    existing_codes = set(result_df['Código do Produto'].tolist())
-
-    # Update existing products
-    for idx, row in result_df.iterrows():
-        product_code = str(row['Código do Produto'])
-        if product_code in inventory_lookup:
-            matches += 1
-            inv_qty = inventory_lookup[product_code]
-            current_estoque = row['Estoque']
-
-            if current_estoque != inv_qty:
-                result_df.at[idx, 'Estoque'] = inv_qty
-                # Recalculate Total
-                pedido = row['Pedido'] if pd.notna(row['Pedido']) else 0
-                result_df.at[idx, 'Total'] = inv_qty + pedido
-                updates += 1
-        else:
-            # Product exists in weekly but not in inventory -> set Estoque to 0
-            if row['Estoque'] != 0:
-                result_df.at[idx, 'Estoque'] = 0
-                # Recalculate Total
-                pedido = row['Pedido'] if pd.notna(row['Pedido']) else 0
-                result_df.at[idx, 'Total'] = pedido
-                zeroed += 1
-
-    # Find products in inventory but not in weekly report
-    inventory_codes = set(inventory_df['Cód Produto'].tolist())
-    new_codes = inventory_codes - existing_codes
-
-    if new_codes:
-        new_rows = []
-        for _, inv_row in inventory_df[inventory_df['Cód Produto'].isin(new_codes)].iterrows():
-            new_rows.append({
-                'Código do Produto': inv_row['Cód Produto'],
-                'Descrição': inv_row['Desc Produto'],
-                'Grupo': f"{inv_row['Cod Grupo']} - {inv_row['Desc GRUPO']}".strip(' -'),
-                'Estoque': inv_row['Quantidade'],
-                'Pedido': None,
-                'Total': inv_row['Quantidade'],
-                'Saídas': 0,
-                'Sugestão': None
-            })
-            new_products += 1
-
-        if new_rows:
-            df_new = pd.DataFrame(new_rows)
-            result_df = pd.concat([result_df, df_new], ignore_index=True)
+    # Find products in inventory but not in weekly report (position -1 = absent)
+    positions = existing_codes.unique().get_indexer(inventory_df['Cód Produto'])
+    new_inventory = inventory_df[positions == -1]
+
+    if len(new_inventory) > 0:
+        grupo = (
+            new_inventory['Cod Grupo'].astype(str) + ' - ' + new_inventory['Desc GRUPO'].astype(str)
+        ).str.strip(' -')
+        df_new = pd.DataFrame({
+            'Código do Produto': new_inventory['Cód Produto'].to_numpy(),
+            'Descrição': new_inventory['Desc Produto'].to_numpy(),
+            'Grupo': grupo.to_numpy(),
+            'Estoque': new_inventory['Quantidade'].to_numpy(),
+            'Pedido': None,
+            'Total': new_inventory['Quantidade'].to_numpy(),
+            'Saídas': 0,
+            'Sugestão': None
+        })
+        new_products = len(df_new)
+        result_df = pd.concat([result_df, df_new], ignore_index=True)
 
     print(f"   Products matched: {matches}")
     print(f"   Estoque values updated: {updates}")
@@ -138,24 +196,18 @@ def create_output(df: pd.DataFrame, output_path: str):
     Sorted by Grupo (1014 - Funcionais first, 1013 - Pascoa last), then by Descrição.
     """
     # Custom sort: 1014-Funcionais first, 1013-Pascoa last, middle sorted by Descrição ASC
-    def grupo_priority(grupo):
-        if pd.isna(grupo) or grupo == '':
-            return 1  # Middle
-        grupo_str = str(grupo)
-        if '1014' in grupo_str and 'Funcionais' in grupo_str:
-            return 0  # First
-        if '1013' in grupo_str and 'Pascoa' in grupo_str:
-            return 2  # Last
-        return 1  # Middle
+    # (empty Grupo falls in the middle)
+    grupo = df['Grupo'].astype(str)
+    is_first = grupo.str.contains('1014', regex=False) & grupo.str.contains('Funcionais', regex=False)
+    is_last = grupo.str.contains('1013', regex=False) & grupo.str.contains('Pascoa', regex=False)
 
     df_output = df.copy()
-    df_output['_priority'] = df_output['Grupo'].apply(grupo_priority)
+    df_output['_priority'] = np.select([is_first, is_last], [0, 2], default=1)
     df_output = df_output.sort_values(['_priority', 'Descrição'])
     df_output = df_output.drop(columns=['_priority'])
 
     # Write to Excel
-    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-        df_output.to_excel(writer, sheet_name='Faturamento por Produtos', index=False)
+    write_sheet(df_output, 'Faturamento por Produtos', output_path)
 
     print(f"\nOutput saved to: {output_path}")
     return df_output
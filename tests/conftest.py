@@ -1,10 +1,12 @@
 """Shared pytest fixtures for Cacau Show API tests."""
 
+from collections.abc import AsyncIterator
 from io import BytesIO
 
+import fitz  # PyMuPDF
 import pandas as pd
 import pytest
-from fastapi.testclient import TestClient
+from httpx import ASGITransport, AsyncClient
 
 from app.main import app
 from app.services.pdf_parser import PDFParserService
@@ -24,21 +26,51 @@ def transformation_service(pdf_parser_service: PDFParserService) -> Transformati
     return TransformationService(pdf_parser=pdf_parser_service)
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def comparison_service() -> ComparisonService:
-    """Fixture for ComparisonService instance."""
+    """
+    Fixture for a ComparisonService instance shared by the whole session.
+
+    Its only state is the parsed report cache, keyed by content and returning
+    copies, so sharing it cannot leak results between tests.
+    """
     return ComparisonService()
 
 
 @pytest.fixture
-def client() -> TestClient:
-    """Fixture for FastAPI TestClient."""
-    return TestClient(app)
+async def async_client() -> AsyncIterator[AsyncClient]:
+    """Fixture for an httpx AsyncClient calling the ASGI app in-process."""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
 
 
-@pytest.fixture
-def sample_weekly_excel() -> BytesIO:
-    """Create a sample weekly report Excel file in memory."""
+def _excel_bytes(df: pd.DataFrame, sheet_name: str, header: bool = True) -> bytes:
+    """Serialize a DataFrame to xlsx bytes."""
+    # xlsxwriter is much faster than openpyxl; constant_memory is left off
+    # because to_excel writes column by column
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        df.to_excel(writer, sheet_name=sheet_name, index=False, header=header)
+    return output.getvalue()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _warm_excel_engines() -> None:
+    """
+    Import the Excel engines once per session (per xdist worker).
+
+    pandas imports its readers and writers lazily on first use, which would
+    otherwise be charged to whichever test happens to run first.
+    """
+    content = _excel_bytes(pd.DataFrame({"a": [1]}), "Sheet")
+    for engine in ("calamine", "openpyxl"):
+        pd.read_excel(BytesIO(content), engine=engine)
+
+
+@pytest.fixture(scope="session")
+def sample_weekly_excel_bytes() -> bytes:
+    """Create a sample weekly report Excel file, built once per session."""
     # Create a DataFrame that mimics the weekly report structure
     # First row is metadata, second row is headers, then data
     df = pd.DataFrame(
@@ -51,16 +83,18 @@ def sample_weekly_excel() -> BytesIO:
         }
     )
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, sheet_name="Faturamento por Produtos", index=False, header=False)
-    output.seek(0)
-    return output
+    return _excel_bytes(df, "Faturamento por Produtos", header=False)
 
 
 @pytest.fixture
-def sample_inventory_excel() -> BytesIO:
-    """Create a sample inventory Excel file in memory."""
+def sample_weekly_excel(sample_weekly_excel_bytes: bytes) -> BytesIO:
+    """Sample weekly report, as a fresh BytesIO per test."""
+    return BytesIO(sample_weekly_excel_bytes)
+
+
+@pytest.fixture(scope="session")
+def sample_inventory_excel_bytes() -> bytes:
+    """Create a sample inventory Excel file, built once per session."""
     # Create a DataFrame that mimics the inventory structure
     df = pd.DataFrame(
         {
@@ -78,16 +112,18 @@ def sample_inventory_excel() -> BytesIO:
         }
     )
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, sheet_name="Estoque Produtos com Valor", index=False, header=False)
-    output.seek(0)
-    return output
+    return _excel_bytes(df, "Estoque Produtos com Valor", header=False)
 
 
 @pytest.fixture
-def sample_transformed_excel() -> BytesIO:
-    """Create a sample transformed weekly report Excel file."""
+def sample_inventory_excel(sample_inventory_excel_bytes: bytes) -> BytesIO:
+    """Sample inventory, as a fresh BytesIO per test."""
+    return BytesIO(sample_inventory_excel_bytes)
+
+
+@pytest.fixture(scope="session")
+def sample_transformed_excel_bytes() -> bytes:
+    """Create a sample transformed weekly report Excel file, built once per session."""
     df = pd.DataFrame(
         {
             "Código do Produto": ["1234567", "2345678", "4567890"],
@@ -101,16 +137,18 @@ def sample_transformed_excel() -> BytesIO:
         }
     )
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, sheet_name="Faturamento por Produtos", index=False)
-    output.seek(0)
-    return output
+    return _excel_bytes(df, "Faturamento por Produtos")
 
 
 @pytest.fixture
-def sample_mazza_excel() -> BytesIO:
-    """Create a sample Mazza report Excel file."""
+def sample_transformed_excel(sample_transformed_excel_bytes: bytes) -> BytesIO:
+    """Sample transformed weekly report, as a fresh BytesIO per test."""
+    return BytesIO(sample_transformed_excel_bytes)
+
+
+@pytest.fixture(scope="session")
+def sample_mazza_excel_bytes() -> bytes:
+    """Create a sample Mazza report Excel file, built once per session."""
     df = pd.DataFrame(
         {
             "CODIGO": ["1234567", "9999999"],
@@ -121,16 +159,18 @@ def sample_mazza_excel() -> BytesIO:
         }
     )
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, sheet_name="RankingFaturamento", index=False)
-    output.seek(0)
-    return output
+    return _excel_bytes(df, "RankingFaturamento")
 
 
 @pytest.fixture
-def sample_inventory_excel_1225() -> BytesIO:
-    """Create a sample inventory Excel file for store 1225."""
+def sample_mazza_excel(sample_mazza_excel_bytes: bytes) -> BytesIO:
+    """Sample Mazza report, as a fresh BytesIO per test."""
+    return BytesIO(sample_mazza_excel_bytes)
+
+
+@pytest.fixture(scope="session")
+def sample_inventory_excel_1225_bytes() -> bytes:
+    """Create a sample inventory Excel file for store 1225, built once per session."""
     df = pd.DataFrame(
         {
             0: ["Header Row", "Cód. Loja", "1225", "1225"],
@@ -147,8 +187,35 @@ def sample_inventory_excel_1225() -> BytesIO:
         }
     )
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, sheet_name="Estoque Produtos com Valor", index=False, header=False)
-    output.seek(0)
-    return output
+    return _excel_bytes(df, "Estoque Produtos com Valor", header=False)
+
+
+@pytest.fixture
+def sample_inventory_excel_1225(sample_inventory_excel_1225_bytes: bytes) -> BytesIO:
+    """Sample store 1225 inventory, as a fresh BytesIO per test."""
+    return BytesIO(sample_inventory_excel_1225_bytes)
+
+
+def _make_pdf(lines: list[str]) -> bytes:
+    """Build a single-page PDF with one text line per entry."""
+    pdf = fitz.open()
+    page = pdf.new_page()
+    for i, line in enumerate(lines):
+        page.insert_text((20, 20 + 12 * i), line)
+    content = pdf.tobytes()
+    pdf.close()
+    return content
+
+
+@pytest.fixture(scope="session")
+def sample_nf_pdf() -> bytes:
+    """Create a sample NF PDF with one product (2 packages of 15 units)."""
+    return _make_pdf(
+        ["CÓD. PRODUTO", "1234567", "PRODUTO TESTE A 100GX15UN X 15", "UN", "2,000"]
+    )
+
+
+@pytest.fixture(scope="session")
+def sample_pedido_pdf() -> bytes:
+    """Create a sample Pedido PDF with one product (3 packages of 10 units)."""
+    return _make_pdf(["ITEM", "10", "2456789", "PDF PRODUTO DESC X10UN", "3,000"])
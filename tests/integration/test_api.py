@@ -1,20 +1,66 @@
 """Integration tests for API endpoints."""
 
+import os
 import re
+import signal
 from datetime import datetime
 from io import BytesIO
 
-import pandas as pd
 import pytest
-from fastapi.testclient import TestClient
+from httpx import AsyncClient
+from openpyxl import load_workbook
+
+from app.dependencies import get_pdf_executor
+
+
+# relatorio_processado_{YYYY-MM-DD}_loja_{code}_{store}.xlsx for the sample inventory
+# (store "MG UBERLANDIA SH PATIO SABIA")
+_FILENAME_RE = re.compile(
+    r"relatorio_processado_(?P<date>\d{4}-\d{2}-\d{2})"
+    r"_loja_6835_MG_UBERLANDIA_SH_PATIO_SABIA\.xlsx"
+)
+
+
+def _read_header(content: bytes) -> list[str]:
+    """Read the header row of an output report with openpyxl in read_only mode."""
+    workbook = load_workbook(BytesIO(content), read_only=True, data_only=True)
+    try:
+        sheet = workbook["Faturamento por Produtos"]
+        return list(next(sheet.iter_rows(max_row=1, values_only=True)))
+    finally:
+        workbook.close()
+
+
+def _find_rows(content: bytes, codes: set[str]) -> dict[str, dict]:
+    """
+    Find the first output row of each product code, as {code: {column: value}}.
+
+    Rows are streamed with openpyxl in read_only mode, stopping once every
+    code has been found.
+    """
+    workbook = load_workbook(BytesIO(content), read_only=True, data_only=True)
+    try:
+        rows = workbook["Faturamento por Produtos"].iter_rows(values_only=True)
+        header = next(rows)
+        code_idx = header.index("Código do Produto")
+        found: dict[str, dict] = {}
+        for row in rows:
+            code = str(row[code_idx])
+            if code in codes and code not in found:
+                found[code] = dict(zip(header, row))
+                if len(found) == len(codes):
+                    break
+        return found
+    finally:
+        workbook.close()
 
 
 class TestHealthEndpoint:
     """Tests for /health endpoint."""
 
-    def test_health_check(self, client: TestClient):
+    async def test_health_check(self, async_client: AsyncClient):
         """Test GET /health returns healthy status."""
-        response = client.get("/health")
+        response = await async_client.get("/health")
 
         assert response.status_code == 200
         data = response.json()
@@ -25,9 +71,9 @@ class TestHealthEndpoint:
 class TestRootEndpoint:
     """Tests for / endpoint."""
 
-    def test_root_endpoint(self, client: TestClient):
+    async def test_root_endpoint(self, async_client: AsyncClient):
         """Test GET / returns app info."""
-        response = client.get("/")
+        response = await async_client.get("/")
 
         assert response.status_code == 200
         data = response.json()
@@ -39,13 +85,11 @@ class TestRootEndpoint:
 class TestTransformEndpoint:
     """Tests for /api/reports/transform endpoint."""
 
-    def test_transform_endpoint_success(
-        self, client: TestClient, sample_weekly_excel: BytesIO
+    async def test_transform_endpoint_success(
+        self, async_client: AsyncClient, sample_weekly_excel: BytesIO
     ):
         """Test POST /api/reports/transform with valid data."""
-        sample_weekly_excel.seek(0)
-
-        response = client.post(
+        response = await async_client.post(
             "/api/reports/transform",
             files={"weekly_report": ("weekly.xlsx", sample_weekly_excel)},
         )
@@ -57,15 +101,76 @@ class TestTransformEndpoint:
         )
 
         # Verify it's a valid Excel file
-        result = BytesIO(response.content)
-        df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
-        assert "Código do Produto" in df.columns
-        assert "Pedido" in df.columns
-        assert "Total" in df.columns
+        header = _read_header(response.content)
+        assert "Código do Produto" in header
+        assert "Pedido" in header
+        assert "Total" in header
+
+    async def test_transform_endpoint_with_pdfs(
+        self,
+        async_client: AsyncClient,
+        sample_weekly_excel: BytesIO,
+        sample_nf_pdf: bytes,
+        sample_pedido_pdf: bytes,
+    ):
+        """Test POST /api/reports/transform aggregates quantities from uploaded PDFs."""
+        response = await async_client.post(
+            "/api/reports/transform",
+            files=[
+                ("weekly_report", ("weekly.xlsx", sample_weekly_excel)),
+                ("nf_pdfs", ("nf.pdf", sample_nf_pdf, "application/pdf")),
+                ("pedido_pdfs", ("pedido.pdf", sample_pedido_pdf, "application/pdf")),
+            ],
+        )
+
+        assert response.status_code == 200
+
+        rows = _find_rows(response.content, {"1234567", "2456789"})
+
+        assert rows["1234567"]["Pedido"] == 30  # 2 x 15 units from NF
+        assert rows["2456789"]["Pedido"] == 30  # 3 x 10 units from Pedido (new product)
 
-    def test_transform_endpoint_no_file(self, client: TestClient):
+    async def test_transform_endpoint_recovers_from_dead_pdf_worker(
+        self,
+        async_client: AsyncClient,
+        sample_weekly_excel_bytes: bytes,
+        sample_pedido_pdf: bytes,
+    ):
+        """Test that a PDF request still succeeds after a parser worker died."""
+
+        async def transform(tag: str):
+            # Distinct content per upload, so no result comes from the parse
+            # cache and both PDFs go through the process pool
+            pdfs = [sample_pedido_pdf + f"\n% {tag} {i}\n".encode() for i in range(2)]
+            return await async_client.post(
+                "/api/reports/transform",
+                files=[
+                    ("weekly_report", ("weekly.xlsx", BytesIO(sample_weekly_excel_bytes))),
+                    *(
+                        ("pedido_pdfs", (f"pedido{i}.pdf", pdf, "application/pdf"))
+                        for i, pdf in enumerate(pdfs)
+                    ),
+                ],
+            )
+
+        assert (await transform("before")).status_code == 200
+
+        # Kill a worker, which breaks the whole pool
+        executor = get_pdf_executor()
+        pid, process = next(iter(executor._processes.items()))
+        os.kill(pid, signal.SIGKILL)
+        process.join(timeout=10)
+
+        response = await transform("after")
+
+        assert response.status_code == 200
+        rows = _find_rows(response.content, {"2456789"})
+        assert rows["2456789"]["Pedido"] == 60  # 2 PDFs x 3 x 10 units
+        assert get_pdf_executor() is not executor
+
+    async def test_transform_endpoint_no_file(self, async_client: AsyncClient):
         """Test POST /api/reports/transform without file returns error."""
-        response = client.post("/api/reports/transform")
+        response = await async_client.post("/api/reports/transform")
 
         assert response.status_code == 422  # Validation error
 
@@ -73,17 +178,14 @@ class TestTransformEndpoint:
 class TestCompareEndpoint:
     """Tests for /api/reports/compare endpoint."""
 
-    def test_compare_endpoint_success(
+    async def test_compare_endpoint_success(
         self,
-        client: TestClient,
+        async_client: AsyncClient,
         sample_transformed_excel: BytesIO,
         sample_inventory_excel: BytesIO,
     ):
         """Test POST /api/reports/compare with valid data."""
-        sample_transformed_excel.seek(0)
-        sample_inventory_excel.seek(0)
-
-        response = client.post(
+        response = await async_client.post(
             "/api/reports/compare",
             files={
                 "weekly_report": ("weekly.xlsx", sample_transformed_excel),
@@ -98,17 +200,14 @@ class TestCompareEndpoint:
         )
 
         # Verify it's a valid Excel file
-        result = BytesIO(response.content)
-        df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
-        assert "Código do Produto" in df.columns
+        header = _read_header(response.content)
+        assert "Código do Produto" in header
 
-    def test_compare_endpoint_missing_inventory(
-        self, client: TestClient, sample_transformed_excel: BytesIO
+    async def test_compare_endpoint_missing_inventory(
+        self, async_client: AsyncClient, sample_transformed_excel: BytesIO
     ):
         """Test POST /api/reports/compare without inventory file."""
-        sample_transformed_excel.seek(0)
-
-        response = client.post(
+        response = await async_client.post(
             "/api/reports/compare",
             files={"weekly_report": ("weekly.xlsx", sample_transformed_excel)},
         )
@@ -119,17 +218,14 @@ class TestCompareEndpoint:
 class TestProcessEndpoint:
     """Tests for /api/reports/process endpoint (full pipeline)."""
 
-    def test_process_endpoint_success(
+    async def test_process_endpoint_success(
         self,
-        client: TestClient,
+        async_client: AsyncClient,
         sample_weekly_excel: BytesIO,
         sample_inventory_excel: BytesIO,
     ):
         """Test POST /api/reports/process with valid data."""
-        sample_weekly_excel.seek(0)
-        sample_inventory_excel.seek(0)
-
-        response = client.post(
+        response = await async_client.post(
             "/api/reports/process",
             files={
                 "weekly_report": ("weekly.xlsx", sample_weekly_excel),
@@ -144,8 +240,7 @@ class TestProcessEndpoint:
         )
 
         # Verify the full pipeline output
-        result = BytesIO(response.content)
-        df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
+        header = _read_header(response.content)
 
         # Should have all expected columns with Cód. Loja first
         expected_cols = [
@@ -159,91 +254,84 @@ class TestProcessEndpoint:
             "Saídas",
             "Sugestão",
         ]
-        assert list(df.columns) == expected_cols
+        assert header == expected_cols
 
-    def test_process_endpoint_missing_weekly(
-        self, client: TestClient, sample_inventory_excel: BytesIO
+    async def test_process_endpoint_missing_weekly(
+        self, async_client: AsyncClient, sample_inventory_excel: BytesIO
     ):
         """Test POST /api/reports/process without weekly report."""
-        sample_inventory_excel.seek(0)
-
-        response = client.post(
+        response = await async_client.post(
             "/api/reports/process",
             files={"inventory_report": ("inventory.xlsx", sample_inventory_excel)},
         )
 
         assert response.status_code == 422  # Validation error
 
-    def test_process_endpoint_with_content_disposition(
-        self,
-        client: TestClient,
-        sample_weekly_excel: BytesIO,
-        sample_inventory_excel: BytesIO,
-    ):
-        """Test that response includes correct Content-Disposition header."""
-        sample_weekly_excel.seek(0)
-        sample_inventory_excel.seek(0)
-
-        response = client.post(
-            "/api/reports/process",
-            files={
-                "weekly_report": ("weekly.xlsx", sample_weekly_excel),
-                "inventory_report": ("inventory.xlsx", sample_inventory_excel),
-            },
-        )
 
-        assert response.status_code == 200
-        assert "content-disposition" in response.headers
-        assert "attachment" in response.headers["content-disposition"]
-        assert ".xlsx" in response.headers["content-disposition"]
+class TestDownloadFilename:
+    """Tests for the Content-Disposition filename of the report endpoints."""
 
-    def test_process_endpoint_filename_contains_date_and_store(
+    @pytest.mark.parametrize(
+        ("endpoint", "weekly_fixture"),
+        [
+            ("/api/reports/process", "sample_weekly_excel"),
+            ("/api/reports/compare", "sample_transformed_excel"),
+        ],
+    )
+    async def test_filename_contains_date_and_store(
         self,
-        client: TestClient,
-        sample_weekly_excel: BytesIO,
+        request: pytest.FixtureRequest,
+        async_client: AsyncClient,
         sample_inventory_excel: BytesIO,
+        endpoint: str,
+        weekly_fixture: str,
     ):
-        """Test that Content-Disposition includes date and store name."""
-        sample_weekly_excel.seek(0)
-        sample_inventory_excel.seek(0)
-
-        response = client.post(
-            "/api/reports/process",
+        """Test that the attachment filename includes date and store name."""
+        weekly_excel = request.getfixturevalue(weekly_fixture)
+        response = await async_client.post(
+            endpoint,
             files={
-                "weekly_report": ("weekly.xlsx", sample_weekly_excel),
+                "weekly_report": ("weekly.xlsx", weekly_excel),
                 "inventory_report": ("inventory.xlsx", sample_inventory_excel),
             },
         )
 
         assert response.status_code == 200
         content_disposition = response.headers["content-disposition"]
-
-        # Verify filename format: relatorio_processado_DATE_LOJA.xlsx
-        assert "relatorio_processado_" in content_disposition
-
-        # Verify date format YYYY-MM-DD is present
-        today = datetime.now().strftime("%Y-%m-%d")
-        assert today in content_disposition
-
-        # Verify store name is present (sanitized version of "MG UBERLANDIA SH PATIO SABIA")
-        assert "MG_UBERLANDIA_SH_PATIO_SABIA" in content_disposition
-
-    def test_process_endpoint_with_mazza_report(
+        assert content_disposition.startswith("attachment")
+
+        # Verify filename format, with today's date and the sanitized store name
+        match = _FILENAME_RE.search(content_disposition)
+        assert match is not None
+        assert match["date"] == datetime.now().strftime("%Y-%m-%d")
+
+
+class TestMazzaReport:
+    """Tests for the report endpoints with a Mazza report (store 1225)."""
+
+    @pytest.mark.parametrize(
+        ("endpoint", "weekly_fixture"),
+        [
+            ("/api/reports/process", "sample_weekly_excel"),
+            ("/api/reports/compare", "sample_transformed_excel"),
+        ],
+        ids=["process", "compare"],
+    )
+    async def test_endpoint_with_mazza_report(
         self,
-        client: TestClient,
-        sample_weekly_excel: BytesIO,
+        request: pytest.FixtureRequest,
+        async_client: AsyncClient,
         sample_inventory_excel_1225: BytesIO,
         sample_mazza_excel: BytesIO,
+        endpoint: str,
+        weekly_fixture: str,
     ):
-        """Test POST /api/reports/process with mazza_report for store 1225."""
-        sample_weekly_excel.seek(0)
-        sample_inventory_excel_1225.seek(0)
-        sample_mazza_excel.seek(0)
-
-        response = client.post(
-            "/api/reports/process",
+        """Test that the Mazza report is merged into the output for store 1225."""
+        weekly_excel = request.getfixturevalue(weekly_fixture)
+        response = await async_client.post(
+            endpoint,
             files={
-                "weekly_report": ("weekly.xlsx", sample_weekly_excel),
+                "weekly_report": ("weekly.xlsx", weekly_excel),
                 "inventory_report": ("inventory.xlsx", sample_inventory_excel_1225),
                 "mazza_report": ("mazza.xlsx", sample_mazza_excel),
             },
@@ -256,84 +344,14 @@ class TestProcessEndpoint:
         )
 
         # Verify Mazza data was merged
-        result = BytesIO(response.content)
-        df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
-        df["Código do Produto"] = df["Código do Produto"].astype(str)
-
-        # Check that Mazza-only product was added
-        assert "9999999" in df["Código do Produto"].values
-
-        # Check that existing product got Mazza QUANTIDADE added to Saídas
-        row = df[df["Código do Produto"] == "1234567"].iloc[0]
-        # Original Saídas from weekly was 20, Mazza adds 50 -> 70
-        assert row["Saídas"] == 70
-
-
-class TestCompareEndpointFilename:
-    """Tests for /api/reports/compare endpoint filename format."""
-
-    def test_compare_endpoint_filename_contains_date_and_store(
-        self,
-        client: TestClient,
-        sample_transformed_excel: BytesIO,
-        sample_inventory_excel: BytesIO,
-    ):
-        """Test that Content-Disposition includes date and store name."""
-        sample_transformed_excel.seek(0)
-        sample_inventory_excel.seek(0)
-
-        response = client.post(
-            "/api/reports/compare",
-            files={
-                "weekly_report": ("weekly.xlsx", sample_transformed_excel),
-                "inventory_report": ("inventory.xlsx", sample_inventory_excel),
-            },
-        )
-
-        assert response.status_code == 200
-        content_disposition = response.headers["content-disposition"]
-
-        # Verify filename format: relatorio_processado_DATE_LOJA.xlsx
-        assert "relatorio_processado_" in content_disposition
-
-        # Verify date format YYYY-MM-DD is present
-        today = datetime.now().strftime("%Y-%m-%d")
-        assert today in content_disposition
-
-        # Verify store name is present (sanitized)
-        assert "MG_UBERLANDIA_SH_PATIO_SABIA" in content_disposition
-
-
-class TestCompareEndpointWithMazza:
-    """Tests for /api/reports/compare endpoint with Mazza report."""
-
-    def test_compare_endpoint_with_mazza_report(
-        self,
-        client: TestClient,
-        sample_transformed_excel: BytesIO,
-        sample_inventory_excel_1225: BytesIO,
-        sample_mazza_excel: BytesIO,
-    ):
-        """Test POST /api/reports/compare with mazza_report for store 1225."""
-        sample_transformed_excel.seek(0)
-        sample_inventory_excel_1225.seek(0)
-        sample_mazza_excel.seek(0)
-
-        response = client.post(
-            "/api/reports/compare",
-            files={
-                "weekly_report": ("weekly.xlsx", sample_transformed_excel),
-                "inventory_report": ("inventory.xlsx", sample_inventory_excel_1225),
-                "mazza_report": ("mazza.xlsx", sample_mazza_excel),
-            },
-        )
-
-        assert response.status_code == 200
-
-        # Verify Mazza data was merged
-        result = BytesIO(response.content)
-        df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
-        df["Código do Produto"] = df["Código do Produto"].astype(str)
+        rows = _find_rows(response.content, {"9999999", "1234567"})
 
         # Check that Mazza-only product was added
-        assert "9999999" in df["Código do Produto"].values
+        assert "9999999" in rows
+
+        # Existing product: Saídas is kept, Mazza QUANTIDADE goes to Saídas VD
+        # and Saídas Total adds both (weekly Saídas 20 + Mazza 50 -> 70)
+        row = rows["1234567"]
+        assert row["Saídas"] == 20
+        assert row["Saídas VD"] == 50
+        assert row["Saídas Total"] == 70
@@ -8,6 +8,83 @@ import pytest
 from app.services.comparison import ComparisonService
 
 
+def _compare_report(
+    service: ComparisonService,
+    weekly: bytes,
+    inventory: bytes,
+    mazza: bytes | None = None,
+) -> tuple[pd.DataFrame, str]:
+    """
+    Build the compare report for the given files, without the xlsx round trip.
+
+    The report is indexed by product code (the column is kept) for direct lookups.
+    """
+    result_df, _, store_name = service.build_report(
+        weekly_report=BytesIO(weekly),
+        inventory_report=BytesIO(inventory),
+        mazza_report=BytesIO(mazza) if mazza is not None else None,
+    )
+    return result_df.set_index("Código do Produto", drop=False), store_name
+
+
+@pytest.fixture(scope="module")
+def compared_report(
+    comparison_service: ComparisonService,
+    sample_transformed_excel_bytes: bytes,
+    sample_inventory_excel_bytes: bytes,
+) -> tuple[pd.DataFrame, str]:
+    """Compare output for store 6835, computed once for this module."""
+    return _compare_report(
+        comparison_service, sample_transformed_excel_bytes, sample_inventory_excel_bytes
+    )
+
+
+@pytest.fixture(scope="module")
+def compared_report_with_mazza(
+    comparison_service: ComparisonService,
+    sample_transformed_excel_bytes: bytes,
+    sample_inventory_excel_bytes: bytes,
+    sample_mazza_excel_bytes: bytes,
+) -> tuple[pd.DataFrame, str]:
+    """Compare output for store 6835 given a Mazza report (which is ignored)."""
+    return _compare_report(
+        comparison_service,
+        sample_transformed_excel_bytes,
+        sample_inventory_excel_bytes,
+        sample_mazza_excel_bytes,
+    )
+
+
+@pytest.fixture(scope="module")
+def compared_report_1225(
+    comparison_service: ComparisonService,
+    sample_transformed_excel_bytes: bytes,
+    sample_inventory_excel_1225_bytes: bytes,
+) -> tuple[pd.DataFrame, str]:
+    """Compare output for store 1225 without a Mazza report."""
+    return _compare_report(
+        comparison_service,
+        sample_transformed_excel_bytes,
+        sample_inventory_excel_1225_bytes,
+    )
+
+
+@pytest.fixture(scope="module")
+def compared_report_1225_with_mazza(
+    comparison_service: ComparisonService,
+    sample_transformed_excel_bytes: bytes,
+    sample_inventory_excel_1225_bytes: bytes,
+    sample_mazza_excel_bytes: bytes,
+) -> tuple[pd.DataFrame, str]:
+    """Compare output for store 1225 with the Mazza report merged."""
+    return _compare_report(
+        comparison_service,
+        sample_transformed_excel_bytes,
+        sample_inventory_excel_1225_bytes,
+        sample_mazza_excel_bytes,
+    )
+
+
 class TestReadInventory:
     """Tests for _read_inventory method."""
 
@@ -38,7 +115,7 @@ class TestReadInventory:
         """Test that types are converted properly."""
         df = comparison_service._read_inventory(sample_inventory_excel)
 
-        assert df["Cód Produto"].dtype == object  # string
+        assert df["Cód Produto"].dtype == "string"
         assert df["Quantidade"].dtype in ["int64", "float64"]
 
 
@@ -52,87 +129,47 @@ class TestReadWeeklyReport:
         df = comparison_service._read_weekly_report(sample_transformed_excel)
 
         assert "Código do Produto" in df.columns
-        assert df["Código do Produto"].dtype == object  # string
+        assert df["Código do Produto"].dtype == "string"
 
 
 class TestCompare:
     """Tests for compare method."""
 
-    def test_compare_updates_estoque(
-        self,
-        comparison_service: ComparisonService,
-        sample_transformed_excel: BytesIO,
-        sample_inventory_excel: BytesIO,
-    ):
+    def test_compare_updates_estoque(self, compared_report: tuple[pd.DataFrame, str]):
         """Test that Estoque is updated when inventory value differs."""
-        result, store_name = comparison_service.compare(
-            weekly_report=sample_transformed_excel,
-            inventory_report=sample_inventory_excel,
-        )
+        result_df, store_name = compared_report
 
         assert store_name == "MG UBERLANDIA SH PATIO SABIA"
-        result_df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
-        result_df["Código do Produto"] = result_df["Código do Produto"].astype(str)
 
         # Product 1234567: original Estoque=100, inventory Quantidade=150
-        row = result_df[result_df["Código do Produto"] == "1234567"].iloc[0]
-        assert row["Estoque"] == 150  # Updated from inventory
+        assert result_df.at["1234567", "Estoque"] == 150  # Updated from inventory
 
     def test_compare_sets_estoque_zero_when_not_in_inventory(
-        self,
-        comparison_service: ComparisonService,
-        sample_transformed_excel: BytesIO,
-        sample_inventory_excel: BytesIO,
+        self, compared_report: tuple[pd.DataFrame, str]
     ):
         """Test that Estoque is set to 0 when product not in inventory."""
-        result, _ = comparison_service.compare(
-            weekly_report=sample_transformed_excel,
-            inventory_report=sample_inventory_excel,
-        )
-
-        result_df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
-        result_df["Código do Produto"] = result_df["Código do Produto"].astype(str)
+        result_df, _ = compared_report
 
         # Product 2345678 is in weekly but not in inventory
-        row = result_df[result_df["Código do Produto"] == "2345678"].iloc[0]
-        assert row["Estoque"] == 0
+        assert result_df.at["2345678", "Estoque"] == 0
 
     def test_compare_adds_new_products_from_inventory(
-        self,
-        comparison_service: ComparisonService,
-        sample_transformed_excel: BytesIO,
-        sample_inventory_excel: BytesIO,
+        self, compared_report: tuple[pd.DataFrame, str]
     ):
         """Test that products from inventory not in weekly are added."""
-        result, _ = comparison_service.compare(
-            weekly_report=sample_transformed_excel,
-            inventory_report=sample_inventory_excel,
-        )
-
-        result_df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
-        result_df["Código do Produto"] = result_df["Código do Produto"].astype(str)
+        result_df, _ = compared_report
 
         # Product 3456789 is only in inventory
-        assert "3456789" in result_df["Código do Produto"].values
+        assert "3456789" in result_df.index
 
     def test_compare_recalculates_total(
-        self,
-        comparison_service: ComparisonService,
-        sample_transformed_excel: BytesIO,
-        sample_inventory_excel: BytesIO,
+        self, compared_report: tuple[pd.DataFrame, str]
     ):
         """Test that Total is recalculated after Estoque update."""
-        result, _ = comparison_service.compare(
-            weekly_report=sample_transformed_excel,
-            inventory_report=sample_inventory_excel,
-        )
-
-        result_df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
-        result_df["Código do Produto"] = result_df["Código do Produto"].astype(str)
+        result_df, _ = compared_report
 
         # Product 1234567: Estoque=150 (from inventory), Pedido=25
-        row = result_df[result_df["Código do Produto"] == "1234567"].iloc[0]
-        assert row["Total"] == 175  # 150 + 25
+        assert result_df.at["1234567", "Total"] == 175  # 150 + 25
 
 
 class TestApplySorting:
@@ -303,19 +340,9 @@ class TestEnrichNullGrupo:
         row_not_in_inv = result[result["Código do Produto"] == "9999999"].iloc[0]
         assert row_not_in_inv["Cód. Loja"] == "6835"
 
-    def test_cod_loja_is_first_column(
-        self,
-        comparison_service: ComparisonService,
-        sample_transformed_excel: BytesIO,
-        sample_inventory_excel: BytesIO,
-    ):
+    def test_cod_loja_is_first_column(self, compared_report: tuple[pd.DataFrame, str]):
         """Test that Cód. Loja is the first column in the output."""
-        result, _ = comparison_service.compare(
-            weekly_report=sample_transformed_excel,
-            inventory_report=sample_inventory_excel,
-        )
-
-        result_df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
+        result_df, _ = compared_report
         assert result_df.columns[0] == "Cód. Loja"
 
     def test_does_not_enrich_non_empty_grupo(self, comparison_service: ComparisonService):
@@ -400,51 +427,33 @@ class TestMazzaIntegration:
     """Tests for Mazza report integration."""
 
     def test_mazza_adds_to_existing_saidas(
-        self,
-        comparison_service: ComparisonService,
-        sample_transformed_excel: BytesIO,
-        sample_inventory_excel_1225: BytesIO,
-        sample_mazza_excel: BytesIO,
+        self, compared_report_1225_with_mazza: tuple[pd.DataFrame, str]
     ):
-        """Test that matching products get QUANTIDADE added to Saídas."""
-        result, store_name = comparison_service.compare(
-            weekly_report=sample_transformed_excel,
-            inventory_report=sample_inventory_excel_1225,
-            mazza_report=sample_mazza_excel,
-        )
+        """Test that matching products get QUANTIDADE in Saídas VD and Saídas Total."""
+        result_df, store_name = compared_report_1225_with_mazza
 
         assert store_name == "LOJA STORE 1225"
-        result_df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
-        result_df["Código do Produto"] = result_df["Código do Produto"].astype(str)
 
-        # Product 1234567: original Saídas=20, Mazza QUANTIDADE=50 -> 70
-        row = result_df[result_df["Código do Produto"] == "1234567"].iloc[0]
-        assert row["Saídas"] == 70  # 20 + 50
+        # Product 1234567: original Saídas=20 is kept, Mazza QUANTIDADE=50
+        assert result_df.at["1234567", "Saídas"] == 20
+        assert result_df.at["1234567", "Saídas VD"] == 50
+        assert result_df.at["1234567", "Saídas Total"] == 70  # 20 + 50
 
     def test_mazza_adds_new_products(
-        self,
-        comparison_service: ComparisonService,
-        sample_transformed_excel: BytesIO,
-        sample_inventory_excel_1225: BytesIO,
-        sample_mazza_excel: BytesIO,
+        self, compared_report_1225_with_mazza: tuple[pd.DataFrame, str]
     ):
         """Test that non-matching products are added with NULL columns."""
-        result, _ = comparison_service.compare(
-            weekly_report=sample_transformed_excel,
-            inventory_report=sample_inventory_excel_1225,
-            mazza_report=sample_mazza_excel,
-        )
-
-        result_df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
-        result_df["Código do Produto"] = result_df["Código do Produto"].astype(str)
+        result_df, _ = compared_report_1225_with_mazza
 
         # Product 9999999 is only in Mazza, should be added
-        assert "9999999" in result_df["Código do Produto"].values
+        assert "9999999" in result_df.index
 
-        row = result_df[result_df["Código do Produto"] == "9999999"].iloc[0]
+        row = result_df.loc["9999999"]
         assert str(row["Cód. Loja"]) == "1225"
         assert row["Descrição"] == "PRODUTO NOVO MAZZA"
-        assert row["Saídas"] == 100
+        assert pd.isna(row["Saídas"])
+        assert row["Saídas VD"] == 100
+        assert row["Saídas Total"] == 100
         assert pd.isna(row["Grupo"])
         assert pd.isna(row["Estoque"])
         assert pd.isna(row["Pedido"])
@@ -452,48 +461,25 @@ class TestMazzaIntegration:
         assert pd.isna(row["Sugestão"])
 
     def test_mazza_ignored_for_non_1225_store(
-        self,
-        comparison_service: ComparisonService,
-        sample_transformed_excel: BytesIO,
-        sample_inventory_excel: BytesIO,
-        sample_mazza_excel: BytesIO,
+        self, compared_report_with_mazza: tuple[pd.DataFrame, str]
     ):
         """Test that Mazza data is ignored for stores other than 1225."""
-        result, _ = comparison_service.compare(
-            weekly_report=sample_transformed_excel,
-            inventory_report=sample_inventory_excel,  # Store 6835, not 1225
-            mazza_report=sample_mazza_excel,
-        )
-
-        result_df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
-        result_df["Código do Produto"] = result_df["Código do Produto"].astype(str)
+        result_df, _ = compared_report_with_mazza
 
         # Product 1234567: original Saídas=20, should NOT have Mazza added
-        row = result_df[result_df["Código do Produto"] == "1234567"].iloc[0]
-        assert row["Saídas"] == 20  # Unchanged
+        assert result_df.at["1234567", "Saídas"] == 20  # Unchanged
 
         # Product 9999999 from Mazza should NOT be added
-        assert "9999999" not in result_df["Código do Produto"].values
+        assert "9999999" not in result_df.index
 
     def test_mazza_report_none_is_ignored(
-        self,
-        comparison_service: ComparisonService,
-        sample_transformed_excel: BytesIO,
-        sample_inventory_excel_1225: BytesIO,
+        self, compared_report_1225: tuple[pd.DataFrame, str]
     ):
         """Test that None mazza_report doesn't break processing."""
-        result, _ = comparison_service.compare(
-            weekly_report=sample_transformed_excel,
-            inventory_report=sample_inventory_excel_1225,
-            mazza_report=None,
-        )
-
-        result_df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
-        result_df["Código do Produto"] = result_df["Código do Produto"].astype(str)
+        result_df, _ = compared_report_1225
 
         # Product 1234567: original Saídas=20, should be unchanged
-        row = result_df[result_df["Código do Produto"] == "1234567"].iloc[0]
-        assert row["Saídas"] == 20  # Unchanged
+        assert result_df.at["1234567", "Saídas"] == 20  # Unchanged
 
     def test_read_mazza_report(
         self, comparison_service: ComparisonService, sample_mazza_excel: BytesIO
@@ -503,10 +489,10 @@ class TestMazzaIntegration:
 
         assert list(df.columns) == ["CODIGO", "NOME PRODUTO", "QUANTIDADE"]
         assert len(df) == 2
-        assert df["CODIGO"].dtype == object  # string
+        assert df["CODIGO"].dtype == "string"
 
     def test_merge_mazza_report_adds_quantity(self, comparison_service: ComparisonService):
-        """Test _merge_mazza_report adds QUANTIDADE to existing Saídas."""
+        """Test _merge_mazza_report adds QUANTIDADE to Saídas in Saídas Total."""
         result_df = pd.DataFrame(
             {
                 "Cód. Loja": ["1225"],
@@ -532,7 +518,9 @@ class TestMazzaIntegration:
         merged = comparison_service._merge_mazza_report(result_df, mazza_df, "1225")
 
         row = merged[merged["Código do Produto"] == "1234567"].iloc[0]
-        assert row["Saídas"] == 70  # 20 + 50
+        assert row["Saídas"] == 20  # Unchanged
+        assert row["Saídas VD"] == 50
+        assert row["Saídas Total"] == 70  # 20 + 50
 
     def test_merge_mazza_report_handles_nan_saidas(self, comparison_service: ComparisonService):
         """Test _merge_mazza_report handles NaN Saídas correctly."""
@@ -561,4 +549,66 @@ class TestMazzaIntegration:
         merged = comparison_service._merge_mazza_report(result_df, mazza_df, "1225")
 
         row = merged[merged["Código do Produto"] == "1234567"].iloc[0]
-        assert row["Saídas"] == 50  # 0 + 50
+        assert pd.isna(row["Saídas"])
+        assert row["Saídas VD"] == 50
+        assert row["Saídas Total"] == 50  # 0 + 50
+
+
+class TestReadCache:
+    """Tests for caching parsed reports by content hash."""
+
+    def test_same_content_is_parsed_once(self, sample_inventory_excel: BytesIO):
+        """Test that identical content reuses the parsed DataFrame."""
+        # Own instance: the shared fixture may already hold this content
+        service = ComparisonService()
+        content = sample_inventory_excel.getvalue()
+        calls = []
+
+        def reader(excel_content):
+            calls.append(excel_content)
+            return service._read_inventory(excel_content)
+
+        first = service._read_cached(BytesIO(content), reader)
+        second = service._read_cached(BytesIO(content), reader)
+
+        assert len(calls) == 1
+        assert first.equals(second)
+
+    def test_reader_gets_original_file_rewound(self, sample_inventory_excel: BytesIO):
+        """Test that a cache miss hands the reader the same, rewound file object."""
+        service = ComparisonService()
+        seen = []
+
+        def reader(excel_content):
+            seen.append((excel_content, excel_content.tell()))
+            return service._read_inventory(excel_content)
+
+        service._read_cached(sample_inventory_excel, reader)
+
+        assert seen == [(sample_inventory_excel, 0)]
+
+    def test_cached_dataframe_is_not_shared(
+        self, comparison_service: ComparisonService, sample_inventory_excel: BytesIO
+    ):
+        """Test that callers cannot mutate the cached DataFrame."""
+        content = sample_inventory_excel.getvalue()
+
+        first = comparison_service._read_cached(
+            BytesIO(content), comparison_service._read_inventory
+        )
+        first["Quantidade"] = 0
+        second = comparison_service._read_cached(
+            BytesIO(content), comparison_service._read_inventory
+        )
+
+        assert second["Quantidade"].tolist() == [150, 30]
+
+    def test_cache_evicts_least_recently_used(self, sample_mazza_excel: BytesIO):
+        """Test that the cache is bounded by cache_size."""
+        service = ComparisonService(cache_size=1)
+        content = sample_mazza_excel.getvalue()
+
+        service._read_cached(BytesIO(content), service._read_mazza_report)
+        service._read_cached(BytesIO(content + b"\0"), service._read_mazza_report)
+
+        assert len(service._cache) == 1
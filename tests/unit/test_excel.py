@@ -0,0 +1,40 @@
+"""Unit tests for Excel writing helpers."""
+
+import numpy as np
+import pandas as pd
+
+from app.services.excel import write_dataframe
+
+
+class TestWriteDataframe:
+    """Tests for write_dataframe function."""
+
+    def test_write_dataframe_round_trip(self):
+        """Test that all rows and columns are written in order."""
+        df = pd.DataFrame(
+            {
+                "Código do Produto": ["1234567", "2345678", "3456789"],
+                "Descrição": ["PRODUTO A", "PRODUTO B", "PRODUTO C"],
+                "Estoque": [100, 50, 30],
+            }
+        )
+
+        result = write_dataframe(df, sheet_name="Faturamento por Produtos")
+        result_df = pd.read_excel(
+            result, sheet_name="Faturamento por Produtos", dtype={"Código do Produto": str}
+        )
+
+        assert list(result_df.columns) == list(df.columns)
+        assert result_df.equals(df)
+
+    def test_write_dataframe_missing_values_are_blank(self):
+        """Test that NaN and None are written as empty cells."""
+        df = pd.DataFrame({"Pedido": [np.nan, 10.0], "Sugestão": [None, None]})
+
+        result = write_dataframe(df, sheet_name="Sheet")
+        result_df = pd.read_excel(result, sheet_name="Sheet")
+
+        assert pd.isna(result_df.loc[0, "Pedido"])
+        assert result_df.loc[1, "Pedido"] == 10
+        assert result_df["Sugestão"].isna().all()
+
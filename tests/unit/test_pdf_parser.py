@@ -8,125 +8,78 @@ from app.services.pdf_parser import PDFParserService
 class TestExtractUnitsFromDescription:
     """Tests for extract_units_from_description method."""
 
-    def test_extract_units_pattern_x_number(self, pdf_parser_service: PDFParserService):
-        """Test extraction of 'X 15' pattern at end of description."""
-        description = "TABLETE LACREME BRANCO ZA 100GX15UN X 15"
-        result = pdf_parser_service.extract_units_from_description(description)
-        assert result == 15
-
-    def test_extract_units_pattern_x_number_different_value(
-        self, pdf_parser_service: PDFParserService
-    ):
-        """Test extraction of 'X 20' pattern."""
-        description = "SOME PRODUCT X 20"
-        result = pdf_parser_service.extract_units_from_description(description)
-        assert result == 20
-
-    def test_extract_units_pattern_gx_un(self, pdf_parser_service: PDFParserService):
-        """Test extraction of '100GX15UN' pattern."""
-        description = "TABLETE LACREME 100GX15UN"
-        result = pdf_parser_service.extract_units_from_description(description)
-        assert result == 15
-
-    def test_extract_units_pattern_kgx_un(self, pdf_parser_service: PDFParserService):
-        """Test extraction of '1KGX5UN' pattern."""
-        description = "PRODUTO GRANDE 1KGX5UN"
-        result = pdf_parser_service.extract_units_from_description(description)
-        assert result == 5
-
-    def test_extract_units_pattern_gx_u(self, pdf_parser_service: PDFParserService):
-        """Test extraction of '100GX15U' pattern (without N)."""
-        description = "TABLETE 100GX15U"
-        result = pdf_parser_service.extract_units_from_description(description)
-        assert result == 15
-
-    def test_extract_units_pattern_x_un_no_weight(
-        self, pdf_parser_service: PDFParserService
+    @pytest.mark.parametrize(
+        ("description", "expected"),
+        [
+            # 'X 15' pattern at end of description
+            pytest.param("TABLETE LACREME BRANCO ZA 100GX15UN X 15", 15, id="x_number"),
+            pytest.param("SOME PRODUCT X 20", 20, id="x_number_different_value"),
+            # '100GX15UN' and '1KGX5UN' patterns
+            pytest.param("TABLETE LACREME 100GX15UN", 15, id="gx_un"),
+            pytest.param("PRODUTO GRANDE 1KGX5UN", 5, id="kgx_un"),
+            # '100GX15U' pattern (without N)
+            pytest.param("TABLETE 100GX15U", 15, id="gx_u"),
+            # 'X15UN' pattern without weight prefix
+            pytest.param("PRODUTO X15UN", 15, id="x_un_no_weight"),
+            # 1 is returned when no pattern matches or the input is empty
+            pytest.param("PRODUTO SEM UNIDADES", 1, id="no_match"),
+            pytest.param("", 1, id="empty_string"),
+            pytest.param(None, 1, id="none_input"),
+            # Lowercase patterns are also matched
+            pytest.param("tablete 100gx15un x 15", 15, id="lowercase"),
+        ],
+    )
+    def test_extract_units(
+        self, pdf_parser_service: PDFParserService, description: str, expected: int
     ):
-        """Test extraction of 'X15UN' pattern without weight prefix."""
-        description = "PRODUTO X15UN"
-        result = pdf_parser_service.extract_units_from_description(description)
-        assert result == 15
-
-    def test_extract_units_no_match(self, pdf_parser_service: PDFParserService):
-        """Test that 1 is returned when no pattern matches."""
-        description = "PRODUTO SEM UNIDADES"
+        """Test extraction of the units per package from a description."""
         result = pdf_parser_service.extract_units_from_description(description)
-        assert result == 1
-
-    def test_extract_units_empty_string(self, pdf_parser_service: PDFParserService):
-        """Test that empty input returns 1."""
-        result = pdf_parser_service.extract_units_from_description("")
-        assert result == 1
-
-    def test_extract_units_none_input(self, pdf_parser_service: PDFParserService):
-        """Test that None input returns 1."""
-        result = pdf_parser_service.extract_units_from_description(None)
-        assert result == 1
-
-    def test_extract_units_lowercase(self, pdf_parser_service: PDFParserService):
-        """Test that lowercase patterns are also matched."""
-        description = "tablete 100gx15un x 15"
-        result = pdf_parser_service.extract_units_from_description(description)
-        assert result == 15
+        assert result == expected
 
 
 class TestNormalizeDescription:
     """Tests for normalize_description method."""
 
-    def test_normalize_description_removes_trailing_x_number(
-        self, pdf_parser_service: PDFParserService
-    ):
-        """Test removal of trailing 'X 15' suffix."""
-        description = "TABLETE LACREME BRANCO ZA X 15"
-        result = pdf_parser_service.normalize_description(description)
-        assert result == "TABLETE LACREME BRANCO ZA"
-
-    def test_normalize_description_removes_unit_info(
-        self, pdf_parser_service: PDFParserService
-    ):
-        """Test removal of '100GX15UN' pattern."""
-        description = "TABLETE LACREME 100GX15UN BRANCO"
-        result = pdf_parser_service.normalize_description(description)
-        assert result == "TABLETE LACREME BRANCO"
-
-    def test_normalize_description_removes_both_patterns(
-        self, pdf_parser_service: PDFParserService
-    ):
-        """Test removal of both patterns from description."""
-        description = "TABLETE LACREME BRANCO ZA 100GX15UN X 15"
-        result = pdf_parser_service.normalize_description(description)
-        assert result == "TABLETE LACREME BRANCO ZA"
-
-    def test_normalize_description_removes_decimal_weight(
-        self, pdf_parser_service: PDFParserService
-    ):
-        """Test removal of decimal weight pattern like '13,5GX150UN'."""
-        description = "BOMBOM 13,5GX150UN ESPECIAL"
-        result = pdf_parser_service.normalize_description(description)
-        assert result == "BOMBOM ESPECIAL"
-
-    def test_normalize_description_empty_string(
-        self, pdf_parser_service: PDFParserService
-    ):
-        """Test that empty input returns empty string."""
-        result = pdf_parser_service.normalize_description("")
-        assert result == ""
-
-    def test_normalize_description_none_input(
-        self, pdf_parser_service: PDFParserService
+    @pytest.mark.parametrize(
+        ("description", "expected"),
+        [
+            pytest.param(
+                "TABLETE LACREME BRANCO ZA X 15",
+                "TABLETE LACREME BRANCO ZA",
+                id="removes_trailing_x_number",
+            ),
+            pytest.param(
+                "TABLETE LACREME 100GX15UN BRANCO",
+                "TABLETE LACREME BRANCO",
+                id="removes_unit_info",
+            ),
+            pytest.param(
+                "TABLETE LACREME BRANCO ZA 100GX15UN X 15",
+                "TABLETE LACREME BRANCO ZA",
+                id="removes_both_patterns",
+            ),
+            # Decimal weight pattern like '13,5GX150UN'
+            pytest.param(
+                "BOMBOM 13,5GX150UN ESPECIAL",
+                "BOMBOM ESPECIAL",
+                id="removes_decimal_weight",
+            ),
+            # Empty input returns empty string
+            pytest.param("", "", id="empty_string"),
+            pytest.param(None, "", id="none_input"),
+            pytest.param(
+                "TABLETE   LACREME    BRANCO",
+                "TABLETE LACREME BRANCO",
+                id="cleans_extra_spaces",
+            ),
+        ],
+    )
+    def test_normalize_description(
+        self, pdf_parser_service: PDFParserService, description: str, expected: str
     ):
-        """Test that None input returns empty string."""
-        result = pdf_parser_service.normalize_description(None)
-        assert result == ""
-
-    def test_normalize_description_cleans_extra_spaces(
-        self, pdf_parser_service: PDFParserService
-    ):
-        """Test that extra spaces are cleaned up."""
-        description = "TABLETE   LACREME    BRANCO"
+        """Test normalization of a PDF description to the Excel format."""
         result = pdf_parser_service.normalize_description(description)
-        assert result == "TABLETE LACREME BRANCO"
+        assert result == expected
 
 
 class TestParseNfPdf:
@@ -144,6 +97,14 @@ class TestParseNfPdf:
         assert quantities == {}
         assert descriptions == {}
 
+    def test_parse_nf_pdf_leading_bytes_before_header(
+        self, pdf_parser_service: PDFParserService, sample_nf_pdf: bytes
+    ):
+        """Test that a PDF with bytes before its %PDF- header is still parsed."""
+        content = b"\xef\xbb\xbfjunk\n" + sample_nf_pdf
+        quantities, _ = pdf_parser_service.parse_nf_pdf(content)
+        assert quantities == {"1234567": 30}
+
 
 class TestParsePedidoPdf:
     """Tests for parse_pedido_pdf method."""
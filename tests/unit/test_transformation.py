@@ -1,10 +1,13 @@
 """Unit tests for TransformationService."""
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
 
 import pandas as pd
 import pytest
 
+from app.services.pdf_parser import PDFParserService
 from app.services.transformation import TransformationService
 
 
@@ -62,7 +65,9 @@ class TestProcess:
         assert isinstance(result, BytesIO)
 
         # Read the result and verify structure
-        result_df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
+        result_df = pd.read_excel(
+            result, sheet_name="Faturamento por Produtos", engine="calamine"
+        )
         expected_cols = [
             "Código do Produto",
             "Descrição",
@@ -99,7 +104,9 @@ class TestProcess:
         # Restore original method
         transformation_service._process_pdfs = original_process_pdfs
 
-        result_df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
+        result_df = pd.read_excel(
+            result, sheet_name="Faturamento por Produtos", engine="calamine"
+        )
         result_df["Código do Produto"] = result_df["Código do Produto"].astype(str)
 
         # Check new product was added
@@ -129,7 +136,9 @@ class TestProcess:
         # Restore original method
         transformation_service._process_pdfs = original_process_pdfs
 
-        result_df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
+        result_df = pd.read_excel(
+            result, sheet_name="Faturamento por Produtos", engine="calamine"
+        )
         result_df["Código do Produto"] = result_df["Código do Produto"].astype(str)
 
         # Find the row for product 1234567
@@ -150,7 +159,9 @@ class TestProcess:
             pedido_pdfs=[],
         )
 
-        result_df = pd.read_excel(result, sheet_name="Faturamento por Produtos")
+        result_df = pd.read_excel(
+            result, sheet_name="Faturamento por Produtos", engine="calamine"
+        )
 
         # Check if sorted by Descrição
         descriptions = result_df["Descrição"].tolist()
@@ -194,3 +205,115 @@ class TestProcessPdfs:
         # 10 + 15 + 5 = 30
         assert quantities["1234567"] == 30
         assert descriptions["1234567"] == "PRODUTO A"
+
+    def test_process_pdfs_with_executor_matches_sequential(
+        self, pdf_parser_service: PDFParserService
+    ):
+        """Test that parsing through an executor aggregates the same results."""
+        calls = []
+
+        def mock_parse(content):
+            calls.append(content)
+            return ({"1234567": len(content)}, {"1234567": "PRODUTO A"})
+
+        pdf_parser_service.parse_nf_pdf = mock_parse
+        pdf_parser_service.parse_pedido_pdf = mock_parse
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            service = TransformationService(
+                pdf_parser=pdf_parser_service, executor=executor
+            )
+            quantities, descriptions = service._process_pdfs(
+                nf_pdfs=[b"a", b"bb"],
+                pedido_pdfs=[b"ccc", b"dddd"],
+            )
+
+        assert len(calls) == 4
+        assert quantities["1234567"] == 10
+        assert descriptions["1234567"] == "PRODUTO A"
+
+    def test_process_pdfs_with_process_pool(
+        self,
+        pdf_parser_service: PDFParserService,
+        sample_nf_pdf: bytes,
+        sample_pedido_pdf: bytes,
+    ):
+        """Test parsing real PDFs in worker processes, as the API does."""
+        nf_pdfs = [sample_nf_pdf, sample_nf_pdf]
+        pedido_pdfs = [sample_pedido_pdf, sample_pedido_pdf]
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            service = TransformationService(
+                pdf_parser=pdf_parser_service, executor=executor
+            )
+            result = service._process_pdfs(nf_pdfs=nf_pdfs, pedido_pdfs=pedido_pdfs)
+
+        sequential = TransformationService(pdf_parser=PDFParserService())._process_pdfs(
+            nf_pdfs=nf_pdfs, pedido_pdfs=pedido_pdfs
+        )
+        assert result == sequential
+        # 2 NFs x 2 packages x 15 units, 2 pedidos x 3 packages x 10 units
+        assert result[0] == {"1234567": 60, "2456789": 60}
+
+    def test_process_pdfs_retries_after_pool_breaks(
+        self, pdf_parser_service: PDFParserService
+    ):
+        """Test that PDFs pending when the pool breaks are parsed on a new pool."""
+
+        class BreakingExecutor(ThreadPoolExecutor):
+            """Executor whose pool breaks after the first result."""
+
+            def map(self, func, *iterables, **kwargs):
+                results = super().map(func, *iterables, **kwargs)
+
+                def first_then_broken():
+                    yield next(results)
+                    raise BrokenProcessPool("a worker died")
+
+                return first_then_broken()
+
+        def mock_parse(content):
+            return ({"1234567": len(content)}, {"1234567": "PRODUTO A"})
+
+        pdf_parser_service.parse_nf_pdf = mock_parse
+        replaced = []
+
+        def replace_executor(broken):
+            replaced.append(broken)
+            return fresh
+
+        with BreakingExecutor(max_workers=2) as broken, ThreadPoolExecutor(
+            max_workers=2
+        ) as fresh:
+            service = TransformationService(
+                pdf_parser=pdf_parser_service,
+                executor=broken,
+                replace_executor=replace_executor,
+            )
+            quantities, _ = service._process_pdfs(
+                nf_pdfs=[b"a", b"bb", b"ccc"], pedido_pdfs=[]
+            )
+
+        assert quantities["1234567"] == 6
+        assert replaced == [broken]
+        assert service.executor is fresh
+
+    def test_process_pdfs_reuses_cached_results(
+        self, pdf_parser_service: PDFParserService
+    ):
+        """Test that identical PDF content is parsed only once."""
+        calls = []
+
+        def mock_parse(content):
+            calls.append(content)
+            return ({"1234567": 5}, {"1234567": "PRODUTO A"})
+
+        pdf_parser_service.parse_nf_pdf = mock_parse
+        service = TransformationService(pdf_parser=pdf_parser_service)
+
+        first, _ = service._process_pdfs(nf_pdfs=[b"pdf1"], pedido_pdfs=[])
+        second, _ = service._process_pdfs(nf_pdfs=[b"pdf1", b"pdf2"], pedido_pdfs=[])
+
+        assert calls == [b"pdf1", b"pdf2"]
+        assert first["1234567"] == 5
+        assert second["1234567"] == 10
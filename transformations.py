@@ -14,8 +14,15 @@ import pandas as pd
 import fitz  # PyMuPDF
 import re
 import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+from app.services.excel import write_sheet
+# Text flags and table record patterns, shared with the API parser
+from app.services.pdf_parser import RE_NF_RECORD, RE_PEDIDO_RECORD, TEXT_FLAGS
+
 
 # Configuration
 BASE_DIR = Path(__file__).parent
@@ -24,12 +31,24 @@ NF_PDF_DIR = BASE_DIR / "pdfs" / "NF"
 PEDIDOS_PDF_DIR = BASE_DIR / "pdfs" / "pedidos"
 OUTPUT_EXCEL = BASE_DIR / "relatorios_tratados/Relatorio_GAC_Semanal_Output.xlsx"
 
+# Regexes, compiled once at import time
+# Unit info in descriptions: trailing " X 15", "100GX15UN"/"1KGX5UN"/"100GX15U", "X15UN"
+_RE_TRAIL_X = re.compile(r'\s+X\s+(\d+)\s*$')
+_RE_WEIGHT_X_UN = re.compile(r'\d+(?:G|KG)X(\d+)U(?:N)?')
+_RE_X_UN = re.compile(r'X(\d+)UN')
+# Unit info removed when normalizing, including decimal weights like "13,5GX150UN"
+_RE_UNIT_STRIP = re.compile(r'\s*\d+(?:,\d+)?(?:G|KG)X\d+U(?:N)?\s*')
+# Product codes: 7 digits starting with 1 or 2
+_RE_CODE_IN_TEXT = re.compile(r'\b([12]\d{6})\b')
+
 
+@lru_cache(maxsize=4096)
 def extract_units_from_description(description: str) -> int:
     """
     Extract the number of units per package from a product description.
 
-    Patterns:
+    Patterns (in priority order, so they are tried one after another; results
+    are cached since the same products repeat across PDFs):
     - "X 15" at the end (NF format) -> 15
     - "100GX15UN" -> 15
     - "100GX15U" -> 15
@@ -41,17 +60,17 @@ def extract_units_from_description(description: str) -> int:
     desc_upper = description.upper()
 
     # Pattern 1: " X {number}" at the end (NF PDFs)
-    match = re.search(r'\s+X\s+(\d+)\s*$', desc_upper)
+    match = _RE_TRAIL_X.search(desc_upper)
     if match:
         return int(match.group(1))
 
     # Pattern 2: "{weight}GX{units}UN" or "{weight}KGX{units}UN" or "{weight}GX{units}U"
-    match = re.search(r'\d+(?:G|KG)X(\d+)U(?:N)?', desc_upper)
+    match = _RE_WEIGHT_X_UN.search(desc_upper)
     if match:
         return int(match.group(1))
 
     # Pattern 3: "X{units}UN" without weight prefix
-    match = re.search(r'X(\d+)UN', desc_upper)
+    match = _RE_X_UN.search(desc_upper)
     if match:
         return int(match.group(1))
 
@@ -60,7 +79,7 @@ def extract_units_from_description(description: str) -> int:
 
 def extract_product_code(text: str) -> str:
     """Extract product code (7 digit number starting with 1 or 2)."""
-    match = re.search(r'\b([12]\d{6})\b', text)
+    match = _RE_CODE_IN_TEXT.search(text)
     return match.group(1) if match else None
 
 
@@ -74,10 +93,10 @@ def normalize_description(description: str) -> str:
         return ""
 
     # Remove the trailing " X {number}" part
-    desc = re.sub(r'\s+X\s+\d+\s*$', '', description)
+    desc = _RE_TRAIL_X.sub('', description)
 
     # Remove the unit info like "100GX15UN" or "13,5GX150UN"
-    desc = re.sub(r'\s*\d+(?:,\d+)?(?:G|KG)X\d+U(?:N)?\s*', ' ', desc)
+    desc = _RE_UNIT_STRIP.sub(' ', desc)
 
     # Clean up extra spaces
     desc = ' '.join(desc.split())
@@ -85,10 +104,23 @@ def normalize_description(description: str) -> str:
     return desc
 
 
-def parse_nf_pdf(pdf_path: str) -> tuple:
+def open_pdf(pdf_source: str | bytes):
+    """Open a PDF from a file path, or from its content already in memory."""
+    if isinstance(pdf_source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=pdf_source, filetype="pdf")
+    return fitz.open(pdf_source)
+
+
+def _source_name(pdf_source: str | bytes) -> str:
+    """Name a PDF source in messages (raw content is not printed)."""
+    return pdf_source if isinstance(pdf_source, str) else "<in-memory PDF>"
+
+
+def parse_nf_pdf(pdf_source: str | bytes) -> tuple:
     """
     Parse NF (Nota Fiscal) PDF and extract product quantities.
     Column CÓD. PRODUTO contains the product code.
+    pdf_source is a file path or the PDF content as bytes.
 
     Returns a tuple: (quantities_dict, descriptions_dict)
         - quantities_dict: {product_code: total_units}
@@ -98,64 +130,41 @@ def parse_nf_pdf(pdf_path: str) -> tuple:
     descriptions = {}
 
     try:
-        pdf = fitz.open(pdf_path)
-        full_text = ""
-        for page in pdf:
-            full_text += page.get_text()
+        pdf = open_pdf(pdf_source)
+        # Join the page texts once rather than growing a string page by page
+        full_text = "".join(page.get_text("text", flags=TEXT_FLAGS) for page in pdf)
         pdf.close()
 
-        # Find the data table section - look for lines with product codes
-        lines = full_text.split('\n')
-
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-
-            # Check if this line starts with a product code (7 digits starting with 1 or 2)
-            code_match = re.match(r'^([12]\d{6})$', line)
-            if code_match:
-                product_code = code_match.group(1)
-
-                # Next line should be the description
-                if i + 1 < len(lines):
-                    description = lines[i + 1].strip()
-
-                    # Extract units from description
-                    units_per_package = extract_units_from_description(description)
-
-                    # Look for quantity in nearby lines (usually a few lines after)
-                    # The QTDE value appears after NCM/SH, CST, CFOP, UND
-                    # Typically as a decimal like "2,000" or "2.000"
-                    qty = 0
-                    for j in range(i + 2, min(i + 10, len(lines))):
-                        qty_line = lines[j].strip()
-                        # Look for quantity pattern (decimal number)
-                        qty_match = re.match(r'^(\d+)[,.]0{3}$', qty_line)
-                        if qty_match:
-                            qty = int(qty_match.group(1))
-                            break
-
-                    if qty > 0:
-                        total_units = qty * units_per_package
-                        if product_code in quantities:
-                            quantities[product_code] += total_units
-                        else:
-                            quantities[product_code] = total_units
-                            # Store normalized description (only first occurrence)
-                            descriptions[product_code] = normalize_description(description)
-
-            i += 1
+        # One pass over the text: each match is a code line, its description
+        # and the first quantity a few lines later. The QTDE value appears
+        # after NCM/SH, CST, CFOP, UND, typically as a decimal like "2,000"
+        for match in RE_NF_RECORD.finditer(full_text):
+            product_code = match.group(1)
+            description = match.group(2).strip()
+            qty = int(match.group(3))
+
+            if qty > 0:
+                # Extract units from description
+                units_per_package = extract_units_from_description(description)
+                total_units = qty * units_per_package
+                if product_code in quantities:
+                    quantities[product_code] += total_units
+                else:
+                    quantities[product_code] = total_units
+                    # Store normalized description (only first occurrence)
+                    descriptions[product_code] = normalize_description(description)
 
     except Exception as e:
-        print(f"Error parsing NF PDF {pdf_path}: {e}")
+        print(f"Error parsing NF PDF {_source_name(pdf_source)}: {e}")
 
     return quantities, descriptions
 
 
-def parse_pedido_pdf(pdf_path: str) -> tuple:
+def parse_pedido_pdf(pdf_source: str | bytes) -> tuple:
     """
     Parse pedido (order) PDF and extract product quantities.
     Column MATERIAL contains the product code.
+    pdf_source is a file path or the PDF content as bytes.
 
     Returns a tuple: (quantities_dict, descriptions_dict)
         - quantities_dict: {product_code: total_units}
@@ -165,61 +174,38 @@ def parse_pedido_pdf(pdf_path: str) -> tuple:
     descriptions = {}
 
     try:
-        pdf = fitz.open(pdf_path)
-        full_text = ""
-        for page in pdf:
-            full_text += page.get_text()
+        pdf = open_pdf(pdf_source)
+        # Join the page texts once rather than growing a string page by page
+        full_text = "".join(page.get_text("text", flags=TEXT_FLAGS) for page in pdf)
         pdf.close()
 
-        lines = full_text.split('\n')
-
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-
-            # In pedidos PDFs, the format is:
-            # ITEM (10, 20, 30...)
-            # MATERIAL (product code)
-            # DENOMINACAO (description)
-            # QUANTIDADE (quantity with decimals)
-
-            # Check if this is an ITEM number (10, 20, 30, etc.)
-            if re.match(r'^\d{2,3}$', line) and int(line) % 10 == 0:
-                # Next should be product code (MATERIAL column)
-                if i + 1 < len(lines):
-                    code_line = lines[i + 1].strip()
-                    code_match = re.match(r'^([12]\d{6})$', code_line)
-
-                    if code_match:
-                        product_code = code_match.group(1)
-
-                        # Next is description (DENOMINACAO column)
-                        if i + 2 < len(lines):
-                            description = lines[i + 2].strip()
-                            units_per_package = extract_units_from_description(description)
-
-                            # Look for quantity (format: "1,000" or "3,000")
-                            qty = 0
-                            for j in range(i + 3, min(i + 8, len(lines))):
-                                qty_line = lines[j].strip()
-                                qty_match = re.match(r'^(\d+)[,.]0{3}\s*$', qty_line)
-                                if qty_match:
-                                    qty = int(qty_match.group(1))
-                                    break
-
-                            if qty > 0:
-                                total_units = qty * units_per_package
-                                if product_code in quantities:
-                                    quantities[product_code] += total_units
-                                else:
-                                    quantities[product_code] = total_units
-                                    # Store normalized description (only first occurrence)
-                                    descriptions[product_code] = normalize_description(description)
-
-            i += 1
+        # In pedidos PDFs, the format is:
+        # ITEM (10, 20, 30...)
+        # MATERIAL (product code)
+        # DENOMINACAO (description)
+        # QUANTIDADE (quantity with decimals, e.g. "1,000" or "3,000")
+        for match in RE_PEDIDO_RECORD.finditer(full_text):
+            item, product_code, description, qty = match.groups()
+
+            # ITEM numbers are multiples of 10
+            if int(item) % 10 != 0:
+                continue
+
+            description = description.strip()
+            qty = int(qty)
+
+            if qty > 0:
+                units_per_package = extract_units_from_description(description)
+                total_units = qty * units_per_package
+                if product_code in quantities:
+                    quantities[product_code] += total_units
+                else:
+                    quantities[product_code] = total_units
+                    # Store normalized description (only first occurrence)
+                    descriptions[product_code] = normalize_description(description)
 
     except Exception as e:
-        print(f"Error parsing pedido PDF {pdf_path}: {e}")
+        print(f"Error parsing pedido PDF {_source_name(pdf_source)}: {e}")
 
     return quantities, descriptions
 
@@ -228,27 +214,67 @@ def read_source_excel(excel_path: str) -> pd.DataFrame:
     """
     Read the source Excel file and return a cleaned DataFrame.
     """
-    df = pd.read_excel(excel_path, sheet_name='Faturamento por Produtos')
-
-    # The first row contains actual column headers
-    df_clean = df.iloc[1:].copy()
-    df_clean.columns = df.iloc[0].values
-
-    # Select required columns
+    # The second row contains actual column headers (the first one is metadata).
+    # Only the required columns are parsed, kept as read.
     cols = ['Código do Produto', 'Descrição', 'Grupo', 'Estoque', 'Quantidade Líquida']
-    df_clean = df_clean[cols].copy()
+    df_clean = pd.read_excel(
+        excel_path,
+        sheet_name='Faturamento por Produtos',
+        header=1,
+        usecols=cols,
+        dtype={col: object for col in cols},
+        engine='calamine',
+    )[cols]
 
     # Convert numeric columns
     df_clean['Código do Produto'] = df_clean['Código do Produto'].astype(str)
     df_clean['Estoque'] = pd.to_numeric(df_clean['Estoque'], errors='coerce').fillna(0)
     df_clean['Quantidade Líquida'] = pd.to_numeric(df_clean['Quantidade Líquida'], errors='coerce').fillna(0)
 
-    # Filter out totals row
-    df_clean = df_clean[~df_clean['Descrição'].str.contains('Totais', case=False, na=False)]
+    # Filter out totals row (plain substring search, no regex compilation)
+    is_totals = df_clean['Descrição'].str.contains('Totais', case=False, regex=False, na=False)
+    df_clean = df_clean[~is_totals]
 
     return df_clean
 
 
+def _chunksize(n_files: int, workers: int) -> int:
+    """Files per pool task: ~4 tasks per worker, at most 16 files each."""
+    return max(1, min(16, n_files // (workers * 4)))
+
+
+def iter_pdf_results():
+    """
+    Parse all PDFs in NF and pedidos directories, yielding results per file.
+
+    Yields (label, pdf_file, quantities_dict, descriptions_dict) for each NF
+    PDF, then each pedido PDF, in file order as soon as it is available.
+    """
+    nf_files = list(NF_PDF_DIR.glob("*.pdf")) if NF_PDF_DIR.exists() else []
+    pedido_files = list(PEDIDOS_PDF_DIR.glob("*.pdf")) if PEDIDOS_PDF_DIR.exists() else []
+
+    # PDFs are parsed in worker processes. Both batches are submitted up front;
+    # map() yields results in file order, so aggregation (and which description
+    # wins) is the same as a sequential run. Workers live for the whole run, and
+    # chunksize hands each one several files per task to cut IPC round-trips.
+    workers = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # NF PDFs (CÓD. PRODUTO column), then pedidos PDFs (MATERIAL column)
+        nf_results = executor.map(
+            parse_nf_pdf, map(str, nf_files), chunksize=_chunksize(len(nf_files), workers)
+        )
+        pedido_results = executor.map(
+            parse_pedido_pdf, map(str, pedido_files), chunksize=_chunksize(len(pedido_files), workers)
+        )
+
+        for label, files, results in (
+            ("NF", nf_files, nf_results),
+            ("pedido", pedido_files, pedido_results),
+        ):
+            for pdf_file, (quantities, descriptions) in zip(files, results):
+                yield label, pdf_file, quantities, descriptions
+
+
 def process_all_pdfs() -> tuple:
     """
     Process all PDFs in NF and pedidos directories.
@@ -257,40 +283,20 @@ def process_all_pdfs() -> tuple:
         - quantities_dict: {product_code: total_pending_units}
         - descriptions_dict: {product_code: description}
     """
-    all_quantities = {}
+    all_quantities = Counter()
     all_descriptions = {}
 
-    # Process NF PDFs (CÓD. PRODUTO column)
-    if NF_PDF_DIR.exists():
-        for pdf_file in NF_PDF_DIR.glob("*.pdf"):
-            print(f"Processing NF: {pdf_file.name}")
-            quantities, descriptions = parse_nf_pdf(str(pdf_file))
-            for code, qty in quantities.items():
-                if code in all_quantities:
-                    all_quantities[code] += qty
-                else:
-                    all_quantities[code] = qty
-                # Store description if not already present
-                if code not in all_descriptions and code in descriptions:
-                    all_descriptions[code] = descriptions[code]
-            print(f"  Found {len(quantities)} products")
-
-    # Process pedidos PDFs (MATERIAL column)
-    if PEDIDOS_PDF_DIR.exists():
-        for pdf_file in PEDIDOS_PDF_DIR.glob("*.pdf"):
-            print(f"Processing pedido: {pdf_file.name}")
-            quantities, descriptions = parse_pedido_pdf(str(pdf_file))
-            for code, qty in quantities.items():
-                if code in all_quantities:
-                    all_quantities[code] += qty
-                else:
-                    all_quantities[code] = qty
-                # Store description if not already present
-                if code not in all_descriptions and code in descriptions:
-                    all_descriptions[code] = descriptions[code]
-            print(f"  Found {len(quantities)} products")
+    # Reduce per-file results as they arrive
+    for label, pdf_file, quantities, descriptions in iter_pdf_results():
+        print(f"Processing {label}: {pdf_file.name}")
+        all_quantities.update(quantities)
+        # Store description if not already present
+        for code, description in descriptions.items():
+            all_descriptions.setdefault(code, description)
+        print(f"  Found {len(quantities)} products")
 
-    return all_quantities, all_descriptions
+    # Plain dict, so callers never see Counter's implicit 0 for missing codes
+    return dict(all_quantities), all_descriptions
 
 
 def create_final_report(df: pd.DataFrame, pending_quantities: dict, pending_descriptions: dict, output_path: str):
@@ -298,44 +304,45 @@ def create_final_report(df: pd.DataFrame, pending_quantities: dict, pending_desc
     Create the final Excel report with all calculated fields.
     Adds products from PDFs that don't exist in the source Excel.
     """
-    # Get existing product codes from Excel
-    existing_codes = set(df['Código do Produto'].tolist())
+    # Find new products from PDFs (not in Excel), in PDF order
+    new_codes = pd.Index(list(pending_quantities), dtype=object).difference(
+        df['Código do Produto'], sort=False
+    )
 
-    # Find new products from PDFs (not in Excel)
-    new_codes = set(pending_quantities.keys()) - existing_codes
-
-    if new_codes:
+    if len(new_codes) > 0:
         print(f"   Adding {len(new_codes)} new products from PDFs...")
-        # Create rows for new products
-        new_rows = []
-        for code in new_codes:
-            new_rows.append({
-                'Código do Produto': code,
-                'Descrição': pending_descriptions.get(code, f'Produto {code}'),
-                'Grupo': '',  # No group info from PDFs
-                'Estoque': 0,
-                'Quantidade Líquida': 0
-            })
-        df_new = pd.DataFrame(new_rows)
+        # Create rows for new products, column by column
+        df_new = pd.DataFrame({
+            'Código do Produto': new_codes,
+            'Descrição': [pending_descriptions.get(code, f'Produto {code}') for code in new_codes],
+            'Grupo': '',  # No group info from PDFs
+            'Estoque': 0,
+            'Quantidade Líquida': 0,
+        })
         df = pd.concat([df, df_new], ignore_index=True)
 
-    # Add pending orders column (keep NaN for products without pending orders)
-    df['Pedido'] = df['Código do Produto'].map(pending_quantities)
-
-    # Calculate Total = Estoque + Pedido (treat NaN as 0 for calculation)
-    df['Total'] = df['Estoque'].fillna(0) + df['Pedido'].fillna(0)
+    # Add pending orders column with a hash join on the product code
+    # (NaN for products without pending orders)
+    pending_df = pd.DataFrame({
+        'Código do Produto': pd.Series(list(pending_quantities), dtype=object),
+        'Pedido': pd.Series(list(pending_quantities.values()), dtype='int64'),
+    })
+    df = df.merge(pending_df, on='Código do Produto', how='left')
+
+    # Calculate Total = Estoque + Pedido (Estoque is never NaN here; a missing
+    # Pedido counts as 0, filled inside the add without temporaries)
+    df['Total'] = df['Estoque'].add(df['Pedido'], fill_value=0)
     df['Sugestão'] = None
 
     # Rename columns to match expected output
-    df_output = df[['Código do Produto', 'Descrição', 'Grupo', 'Estoque', 'Pedido', 'Total', 'Quantidade Líquida','Sugestão']].copy()
+    df_output = df[['Código do Produto', 'Descrição', 'Grupo', 'Estoque', 'Pedido', 'Total', 'Quantidade Líquida','Sugestão']]
     df_output.columns = ['Código do Produto', 'Descrição', 'Grupo', 'Estoque', 'Pedido', 'Total', 'Saídas','Sugestão']
 
     # Sort by Descrição ascending
     df_output = df_output.sort_values('Descrição')
 
     # Write to Excel
-    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-        df_output.to_excel(writer, sheet_name='Faturamento por Produtos', index=False)
+    write_sheet(df_output, 'Faturamento por Produtos', output_path)
 
     print(f"\nOutput saved to: {output_path}")
     return df_output